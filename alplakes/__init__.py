@@ -1,8 +1,13 @@
 from .get_data_alplakes import (download_3d_timeserie_from_api,
+                                download_3d_timeserie_range_from_api,
+                                download_3d_timeseries_for_stations,
                                 parse_alplakes_3d_timeserie_from_directory,
                                 parse_alplakes_json_3d_timeserie_to_df,
                                 get_3d_profile_from_api,
+                                get_3d_profiles_from_api,
                                 parse_json_3d_profile_to_df,
                                 download_1d_depthtime_from_api,
-                                parse_alplakes_1d_from_directory)
+                                parse_alplakes_1d_from_directory,
+                                consolidate_alplakes_3d_directory,
+                                consolidate_alplakes_1d_directory)
 
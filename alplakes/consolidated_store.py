@@ -0,0 +1,67 @@
+import glob
+import json
+import os
+
+import numpy as np
+import xarray as xr
+
+SOURCE_FILES_ATTR = 'source_files'
+TIME_CHUNK_SIZE = 4096
+
+
+def get_store_path(json_directory_path: str, store_name: str) -> str:
+    return os.path.join(json_directory_path, f'{store_name}.zarr')
+
+
+def list_json_files(json_directory_path: str) -> dict[str, float]:
+    json_files = sorted(glob.glob(os.path.join(json_directory_path, '*.json')))
+
+    return {os.path.basename(file_path): os.path.getmtime(file_path) for file_path in json_files}
+
+
+def read_source_files(store_path: str) -> dict[str, float]:
+    with xr.open_zarr(store_path) as stored_data:
+        return json.loads(stored_data.attrs.get(SOURCE_FILES_ATTR, '{}'))
+
+
+def _write_store(dataset: xr.Dataset, store_path: str, source_files: dict[str, float]) -> None:
+    dataset = dataset.chunk({'time': TIME_CHUNK_SIZE})
+    dataset.attrs[SOURCE_FILES_ATTR] = json.dumps(source_files)
+    for variable in dataset.variables.values():
+        variable.encoding = {}
+    dataset.to_zarr(store_path, mode='w')
+
+
+def update_store(json_directory_path: str, store_path: str, read_json_files) -> None:
+    # read_json_files(list of json paths) must return a time-sorted, deduplicated xr.Dataset.
+    # New files whose data starts after the stored data are appended, any other change
+    # (modified, removed or back-filled files) rewrites the store.
+    json_files = list_json_files(json_directory_path)
+    if not json_files:
+        raise FileNotFoundError(f"No json files found in directory {json_directory_path}")
+
+    stored_files = read_source_files(store_path) if os.path.exists(store_path) else None
+    if stored_files == json_files:
+        return
+
+    unchanged = stored_files is not None and all(json_files.get(name) == mtime for name, mtime in stored_files.items())
+    if unchanged:
+        new_files = [os.path.join(json_directory_path, name) for name in json_files if name not in stored_files]
+        new_data = read_json_files(new_files)
+        with xr.open_zarr(store_path) as stored_data:
+            last_stored_time = stored_data['time'].values[-1]
+        new_times = new_data['time'].values
+        if new_times[0] >= last_stored_time and new_times[-1] > last_stored_time:
+            new_data = new_data.isel(time=np.flatnonzero(new_times > last_stored_time))
+            new_data.attrs[SOURCE_FILES_ATTR] = json.dumps(json_files)
+            for variable in new_data.variables.values():
+                variable.encoding = {}
+            new_data.chunk({'time': TIME_CHUNK_SIZE}).to_zarr(store_path, append_dim='time')
+            return
+
+    all_files = [os.path.join(json_directory_path, name) for name in json_files]
+    _write_store(read_json_files(all_files), store_path, json_files)
+
+
+def open_store(store_path: str) -> xr.Dataset:
+    return xr.open_zarr(store_path)
@@ -1,30 +1,165 @@
 import json
 import os
 import glob
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 import pandas as pd
 import numpy as np
-from datetime import datetime
 import xarray as xr
 
 from utils import (download_json,
-                   open_json)
+                   open_json,
+                   save_json,
+                   fetch_many,
+                   sorted_unique_time_order)
+from .consolidated_store import (get_store_path,
+                                 update_store,
+                                 open_store)
+
+ALPLAKES_DATE_FORMAT = '%Y%m%d%H%M'
+
+
+def get_3d_timeserie_url(lake_name: str, start_date: str, end_date: str, depth: float, lat_wgs84: float,
+                         lon_wgs84: float) -> str:
+    return (f"https://alplakes-api.eawag.ch/simulations/point/delft3d-flow/"
+            f"{lake_name}/"
+            f"{start_date}/"
+            f"{end_date}/"
+            f"{depth}/"
+            f"{lat_wgs84}/"
+            f"{lon_wgs84}"
+            )
 
 
 def download_3d_timeserie_from_api(lake_name: str, start_date: str, end_date: str, depth: float, lat_wgs84: float,
                                    lon_wgs84: float) -> json:
-    url = (f"https://alplakes-api.eawag.ch/simulations/point/delft3d-flow/"
-           f"{lake_name}/"
-           f"{start_date}/"
-           f"{end_date}/"
-           f"{depth}/"
-           f"{lat_wgs84}/"
-           f"{lon_wgs84}"
-           )
+    url = get_3d_timeserie_url(lake_name, start_date, end_date, depth, lat_wgs84, lon_wgs84)
     alplakes_timeserie_data = download_json(url)
 
     return alplakes_timeserie_data
 
 
+def split_date_range(start_date: str, end_date: str, window_freq: str = 'MS') -> list[tuple[str, str]]:
+    # Windows are aligned on calendar boundaries (month starts by default), so that saved files
+    # keep the same name whatever the requested range is.
+    start = pd.to_datetime(start_date, format=ALPLAKES_DATE_FORMAT)
+    end = pd.to_datetime(end_date, format=ALPLAKES_DATE_FORMAT)
+    inner_bounds = pd.date_range(start, end, freq=window_freq, inclusive='neither')
+    bounds = [start, *inner_bounds, end]
+
+    return [(window_start.strftime(ALPLAKES_DATE_FORMAT), window_end.strftime(ALPLAKES_DATE_FORMAT))
+            for window_start, window_end in zip(bounds[:-1], bounds[1:])]
+
+
+def get_window_file_name(window_start: str, window_end: str) -> str:
+    # Both bounds are in the name: a trailing partial window must not be reused later as the full window
+    return f'{window_start}_{window_end}.json'
+
+
+def fetch_json_windows(downloads: dict, max_workers: int = 8) -> dict:
+    # downloads maps a key to (url, save_path), save_path naming the exact window of url. Windows already saved
+    # at save_path are read from disk, the others are downloaded concurrently and saved when save_path is not None.
+    json_windows = {}
+    urls_to_download = {}
+    for key, (url, save_path) in downloads.items():
+        if save_path is not None and os.path.exists(save_path):
+            json_windows[key] = open_json(save_path)
+            continue
+        urls_to_download[url] = (key, save_path)
+
+    failed_windows = []
+    for url, response in fetch_many(urls_to_download, max_workers=max_workers, raise_errors=False):
+        key, save_path = urls_to_download[url]
+        if isinstance(response, Exception):
+            failed_windows.append((key, response))
+            continue
+        json_windows[key] = response.json()
+        if save_path is not None:
+            save_json(json_windows[key], save_path)
+
+    if failed_windows:
+        raise Exception(f"Download failed for windows {[key for key, _ in failed_windows]}: "
+                        f"{failed_windows[0][1]}")
+
+    return json_windows
+
+
+def download_3d_timeserie_range_from_api(lake_name: str, start_date: str, end_date: str, depth: float,
+                                         lat_wgs84: float, lon_wgs84: float, save_folder: str = None,
+                                         window_freq: str = 'MS', max_workers: int = 8) -> pd.DataFrame:
+    windows = split_date_range(start_date, end_date, window_freq)
+    downloads = {
+        window_start: (get_3d_timeserie_url(lake_name, window_start, window_end, depth, lat_wgs84, lon_wgs84),
+                       os.path.join(save_folder, get_window_file_name(window_start, window_end))
+                       if save_folder is not None else None)
+        for window_start, window_end in windows
+    }
+    json_windows = fetch_json_windows(downloads, max_workers)
+
+    dataframes = [parse_alplakes_json_3d_timeserie_to_df(json_windows[window_start])
+                  for window_start, _ in windows]
+    alplakes_timeserie = pd.concat(dataframes, ignore_index=True)
+    alplakes_timeserie = alplakes_timeserie.drop_duplicates(subset='time').sort_values('time', ignore_index=True)
+
+    return alplakes_timeserie
+
+
+def download_3d_timeseries_for_stations(lake_name: str, station_names: list[str], depths: list[float],
+                                        start_date: str, end_date: str,
+                                        config_points_path: str = 'config_points.json', save_folder: str = None,
+                                        window_freq: str = 'MS', max_workers: int = 8) -> xr.Dataset:
+    config_points = open_json(config_points_path)
+    stations = [config_points[station_name] for station_name in station_names]
+    windows = split_date_range(start_date, end_date, window_freq)
+
+    # One request per (station, depth, window), all scheduled at once
+    downloads = {}
+    for station_name, station in zip(station_names, stations):
+        for depth in depths:
+            for window_start, window_end in windows:
+                url = get_3d_timeserie_url(lake_name, window_start, window_end, depth,
+                                           station['lat_station_wgs84'], station['long_station_wgs84'])
+                save_path = None
+                if save_folder is not None:
+                    save_path = os.path.join(save_folder, station_name, f'timeseries_{depth}m',
+                                             get_window_file_name(window_start, window_end))
+                downloads[(station_name, depth, window_start)] = (url, save_path)
+    json_windows = fetch_json_windows(downloads, max_workers)
+
+    series = {}
+    for station_name in station_names:
+        for depth in depths:
+            window_data = [json_windows[(station_name, depth, window_start)] for window_start, _ in windows]
+            times = parse_iso_times([t for data in window_data for t in data['time']])
+            temperatures = np.asarray([value for data in window_data
+                                       for value in data['variables']['temperature']['data']], dtype=float)
+            order = sorted_unique_time_order(times)
+            series[(station_name, depth)] = (times[order], temperatures[order])
+
+    # Stations and depths may not share exactly the same output times: align on their union
+    all_times = np.unique(np.concatenate([times for times, _ in series.values()]))
+    temperature = np.full((len(station_names), len(depths), len(all_times)), np.nan)
+    for i, station_name in enumerate(station_names):
+        for j, depth in enumerate(depths):
+            times, values = series[(station_name, depth)]
+            temperature[i, j, np.searchsorted(all_times, times)] = values
+
+    return xr.Dataset(
+        {
+            'temperature': (['station', 'depth', 'time'], temperature)
+        },
+        coords={
+            'station': station_names,
+            'depth': np.asarray(depths, dtype=float),
+            'time': all_times,
+            'lat_wgs84': ('station', [station['lat_station_wgs84'] for station in stations]),
+            'lon_wgs84': ('station', [station['long_station_wgs84'] for station in stations])
+        }
+    )
+
+
 def parse_alplakes_json_3d_timeserie_to_df(json_data: json) -> pd.DataFrame:
     refactored_data = {
         'time': json_data['time'],
@@ -36,25 +171,65 @@ def parse_alplakes_json_3d_timeserie_to_df(json_data: json) -> pd.DataFrame:
     return df_data
 
 
-def parse_alplakes_3d_timeserie_from_directory(json_directory_path: str) -> pd.DataFrame:
-    json_files_paths = glob.glob(os.path.join(json_directory_path, '*.json'))
+def read_alplakes_3d_json_files(json_files_paths: list[str]) -> xr.Dataset:
+    times = []
+    temperatures = []
+    for json_path in json_files_paths:
+        json_data = _load_json_file(json_path)
+        times.extend(json_data['time'])
+        temperatures.extend(json_data['variables']['temperature']['data'])
+    times = parse_iso_times(times)
+    order = sorted_unique_time_order(times)
+
+    return xr.Dataset(
+        {
+            'temperature': (['time'], np.asarray(temperatures, dtype=float)[order])
+        },
+        coords={
+            'time': times[order]
+        }
+    )
+
+
+def consolidate_alplakes_3d_directory(json_directory_path: str) -> str:
+    store_path = get_store_path(json_directory_path, 'alplakes_3d')
+    update_store(json_directory_path, store_path, read_alplakes_3d_json_files)
+
+    return store_path
+
+
+def _alplakes_3d_dataset_to_df(dataset: xr.Dataset) -> pd.DataFrame:
+    # (time, temperature) rows with a RangeIndex and UTC times, whether the data comes from the store or the files
+    df_data = dataset['temperature'].to_dataframe().reset_index()
+    df_data['time'] = df_data['time'].dt.tz_localize('UTC')
+
+    return df_data
+
+
+def parse_alplakes_3d_timeserie_from_directory(json_directory_path: str, use_store: bool = True) -> pd.DataFrame:
+    store_path = get_store_path(json_directory_path, 'alplakes_3d')
+    if use_store and os.path.exists(store_path):
+        update_store(json_directory_path, store_path, read_alplakes_3d_json_files)
+
+        return _alplakes_3d_dataset_to_df(open_store(store_path))
+
+    json_files_paths = sorted(glob.glob(os.path.join(json_directory_path, '*.json')))
     if not json_files_paths:
         raise FileNotFoundError(f"No json files found in directory {json_directory_path}")
-    dataframes = [
-        parse_alplakes_json_3d_timeserie_to_df(open_json(json_path))
-        for json_path
-        in json_files_paths
-    ]
 
-    return pd.concat(dataframes)
+    return _alplakes_3d_dataset_to_df(read_alplakes_3d_json_files(json_files_paths))
+
+
+def get_3d_profile_url(lake_name: str, date_plot_profile: str, lat_wgs84: float, lon_wgs84: float) -> str:
+    return (f"https://alplakes-api.eawag.ch/simulations/profile/delft3d-flow/"
+            f"{lake_name}/"
+            f"{date_plot_profile}/"
+            f"{lat_wgs84}/"
+            f"{lon_wgs84}")
 
 
 def get_3d_profile_from_api(lake_name: str, date_plot_profile: str, lat_wgs84: float, lon_wgs84: float) -> json:
-    url = (f"https://alplakes-api.eawag.ch/simulations/profile/delft3d-flow/"
-           f"{lake_name}/"
-           f"{date_plot_profile}/"
-           f"{lat_wgs84}/"
-           f"{lon_wgs84}")
+    url = get_3d_profile_url(lake_name, date_plot_profile, lat_wgs84, lon_wgs84)
     alplakes_profile_data = download_json(url)
 
     return alplakes_profile_data
@@ -69,6 +244,55 @@ def parse_json_3d_profile_to_df(json_file: json) -> pd.DataFrame:
     return pd.DataFrame(refactored_data)
 
 
+def get_3d_profiles_from_api(lake_name: str, dates, lat_wgs84: float, lon_wgs84: float,
+                             depth_axis: np.ndarray = None, save_folder: str = None,
+                             max_workers: int = 8) -> xr.Dataset:
+    # dates: alplakes date strings (YYYYmmddHHMM) or anything pd.to_datetime understands, e.g. a pd.date_range
+    if all(isinstance(date, str) for date in dates):
+        dates = pd.to_datetime(list(dates), format=ALPLAKES_DATE_FORMAT)
+    else:
+        dates = pd.to_datetime(list(dates))
+    if dates.tz is not None:
+        dates = dates.tz_convert(None)
+    date_strings = [date.strftime(ALPLAKES_DATE_FORMAT) for date in dates]
+
+    downloads = {
+        date_string: (get_3d_profile_url(lake_name, date_string, lat_wgs84, lon_wgs84),
+                      os.path.join(save_folder, f'{date_string}.json') if save_folder is not None else None)
+        for date_string in date_strings
+    }
+    json_profiles = fetch_json_windows(downloads, max_workers)
+
+    profiles = []
+    for date_string in date_strings:
+        profile_depths = np.asarray(json_profiles[date_string]['depth']['data'], dtype=float)
+        profile_temperatures = np.asarray(json_profiles[date_string]['variables']['temperature']['data'], dtype=float)
+        order = np.argsort(profile_depths)
+        profiles.append((profile_depths[order], profile_temperatures[order]))
+
+    if depth_axis is None:
+        depth_axis = np.unique(np.concatenate([profile_depths for profile_depths, _ in profiles]))
+    depth_axis = np.asarray(depth_axis, dtype=float)
+
+    # Linear interpolation on the common depth axis, NaN outside of each profile's depth range
+    temperature = np.full((len(depth_axis), len(profiles)), np.nan)
+    for i, (profile_depths, profile_temperatures) in enumerate(profiles):
+        valid = ~np.isnan(profile_temperatures)
+        if valid.any():
+            temperature[:, i] = np.interp(depth_axis, profile_depths[valid], profile_temperatures[valid],
+                                          left=np.nan, right=np.nan)
+
+    return xr.Dataset(
+        {
+            'temperature': (['depth', 'time'], temperature)
+        },
+        coords={
+            'time': dates.to_numpy(dtype='datetime64[ns]'),
+            'depth': depth_axis
+        }
+    )
+
+
 def download_1d_depthtime_from_api(lake_name: str, start_date: str, end_date: str) -> json:
     url = (f"https://alplakes-api.eawag.ch/simulations/1d/depthtime/simstrat/"
            f"{lake_name}/"
@@ -94,55 +318,68 @@ def parse_json_1d_timeserie_to_df(json_file: str) -> pd.DataFrame:
     return df_data
 
 
-def parse_alplakes_1d_from_directory(folder_path: str) -> xr.Dataset:
-    json_files = glob.glob(os.path.join(folder_path, f'*.json'))
+def _load_json_file(file_path: str):
+    with open(file_path, 'rb') as file:
+        return json_loads(file.read())
 
-    # Initialize lists to store combined data
-    all_times = []
-    all_depths = []
-    all_temperatures = []
 
-    # Loop through each JSON file
-    for file_path in json_files:
-        # Read the JSON file
-        with open(file_path, 'r') as file:
-            data = json.load(file)
+def parse_iso_times(iso_times: list[str]) -> np.ndarray:
+    # Vectorized ISO 8601 parsing, converted to naive UTC datetime64[ns]
+    times = pd.to_datetime(iso_times, utc=True, format='ISO8601')
 
-        # Extract time data and convert to datetime
-        times = [datetime.fromisoformat(t.replace('Z', '+00:00')) for t in data['time']]
+    return times.tz_convert(None).to_numpy(dtype='datetime64[ns]')
 
-        # Extract depth and temperature data
-        depths = np.array(data['depth']['data'])
-        temperatures = np.array(data['variables']['T']['data'])
 
-        # Append to the combined lists
-        all_times.append(times)
-        all_depths.append(depths)
-        all_temperatures.append(temperatures)
+def read_alplakes_1d_json_files(json_files: list[str]) -> xr.Dataset:
+    json_data = [_load_json_file(file_path) for file_path in json_files]
 
     # Ensure all depth arrays are consistent
-    if len(set(len(d) for d in all_depths)) != 1:
+    if len(set(len(data['depth']['data']) for data in json_data)) != 1:
         raise ValueError("Depth arrays are not consistent across files.")
 
     # Use the first depth array (assumed consistent across files)
-    depths = all_depths[0]
-
-    # Combine all time and temperature data
-    all_times = np.concatenate(all_times)
-    all_times = np.array([dt.replace(tzinfo=None) for dt in all_times])
-    all_temperatures = np.hstack(all_temperatures)
+    depths = np.asarray(json_data[0]['depth']['data'], dtype=float)
+
+    # Preallocate the depth x time output and fill it file by file
+    n_times = [len(data['time']) for data in json_data]
+    all_temperatures = np.empty((len(depths), sum(n_times)), dtype=float)
+    all_iso_times = []
+    offset = 0
+    for data, n_time in zip(json_data, n_times):
+        all_temperatures[:, offset:offset + n_time] = np.asarray(data['variables']['T']['data'], dtype=float)
+        all_iso_times.extend(data['time'])
+        offset += n_time
+    all_times = parse_iso_times(all_iso_times)
+    order = sorted_unique_time_order(all_times)
 
-    # Create xarray dataset
     simstrat_data = xr.Dataset(
         {
-            'temperature': (['depth', 'time'], np.stack(all_temperatures))
+            'temperature': (['depth', 'time'], all_temperatures[:, order])
         },
         coords={
-            'time': all_times,
+            'time': all_times[order],
             'depth': depths
         }
     )
 
-    unique_values, unique_ind = np.unique(simstrat_data['time'].values, return_index=True)
+    return simstrat_data
+
+
+def consolidate_alplakes_1d_directory(folder_path: str) -> str:
+    store_path = get_store_path(folder_path, 'alplakes_1d')
+    update_store(folder_path, store_path, read_alplakes_1d_json_files)
+
+    return store_path
+
+
+def parse_alplakes_1d_from_directory(folder_path: str, use_store: bool = True) -> xr.Dataset:
+    store_path = get_store_path(folder_path, 'alplakes_1d')
+    if use_store and os.path.exists(store_path):
+        update_store(folder_path, store_path, read_alplakes_1d_json_files)
+        return open_store(store_path)
+
+    json_files = sorted(glob.glob(os.path.join(folder_path, f'*.json')))
+    if not json_files:
+        raise FileNotFoundError(f"No json files found in directory {folder_path}")
 
-    return simstrat_data.isel(time=np.sort(unique_ind))
+    return read_alplakes_1d_json_files(json_files)
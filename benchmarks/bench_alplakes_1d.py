@@ -0,0 +1,87 @@
+# Benchmark of alplakes.parse_alplakes_1d_from_directory against the implementation it replaced, on a synthetic
+# directory of monthly Simstrat JSON files. Run from anywhere: python benchmarks/bench_alplakes_1d.py
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from alplakes import parse_alplakes_1d_from_directory
+
+
+def write_simstrat_directory(folder_path: str, years: tuple = (2021, 2022, 2023), n_depths: int = 100,
+                             freq: str = '3h') -> None:
+    # One file per month, the first time of the next month included as the API returns it (overlapping bounds)
+    depths = np.linspace(0, 300, n_depths).tolist()
+    for year in years:
+        for month in range(1, 13):
+            start = pd.Timestamp(year, month, 1)
+            times = pd.date_range(start, start + pd.offsets.MonthBegin(1), freq=freq)
+            temperatures = np.arange(n_depths)[:, None] + (times.asi8[None, :] // 10 ** 9 % 100000) / 1e5
+            json_data = {
+                'time': [timestamp.strftime('%Y-%m-%dT%H:%M:%S+00:00') for timestamp in times],
+                'depth': {'data': depths},
+                'variables': {'T': {'data': temperatures.tolist()}}
+            }
+            with open(os.path.join(folder_path, f'{start:%Y%m%d%H%M}.json'), 'w') as file:
+                json.dump(json_data, file)
+
+
+def baseline_parse_alplakes_1d_from_directory(folder_path: str) -> xr.Dataset:
+    # Implementation before the vectorized parser, kept as the reference
+    all_times = []
+    all_depths = []
+    all_temperatures = []
+    for file_path in glob.glob(os.path.join(folder_path, '*.json')):
+        with open(file_path, 'r') as file:
+            data = json.load(file)
+        all_times.append([datetime.fromisoformat(t.replace('Z', '+00:00')) for t in data['time']])
+        all_depths.append(np.array(data['depth']['data']))
+        all_temperatures.append(np.array(data['variables']['T']['data']))
+
+    if len(set(len(d) for d in all_depths)) != 1:
+        raise ValueError("Depth arrays are not consistent across files.")
+    all_times = np.array([dt.replace(tzinfo=None) for dt in np.concatenate(all_times)])
+    simstrat_data = xr.Dataset(
+        {
+            'temperature': (['depth', 'time'], np.stack(np.hstack(all_temperatures)))
+        },
+        coords={
+            'time': all_times,
+            'depth': all_depths[0]
+        }
+    )
+    _, unique_ind = np.unique(simstrat_data['time'].values, return_index=True)
+
+    return simstrat_data.isel(time=np.sort(unique_ind))
+
+
+def best_time(function, repeats: int = 3) -> tuple[float, xr.Dataset]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), result
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as folder_path:
+        write_simstrat_directory(folder_path)
+        baseline_time, expected = best_time(lambda: baseline_parse_alplakes_1d_from_directory(folder_path))
+        current_time, result = best_time(lambda: parse_alplakes_1d_from_directory(folder_path, use_store=False))
+
+    expected = expected.sortby('time')
+    print(f"{len(result['time'])} times x {len(result['depth'])} depths")
+    print(f"baseline  {baseline_time:.2f} s")
+    print(f"current   {current_time:.2f} s")
+    print("identical values:", np.array_equal(expected['time'].values, result['time'].values)
+          and np.allclose(expected['temperature'].values, result['temperature'].values))
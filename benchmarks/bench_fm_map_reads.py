@@ -0,0 +1,107 @@
+# Benchmark of the reads of the faces used by a raster regridder or a transect in a Delft3D-FM map file: the
+# contiguous box of faces read before, integer-array indexing, and the runs of SparseInterpolator.read_box.
+# Synthetic maps with the faces in mesh order and shuffled (worst case). Run: python benchmarks/bench_fm_map_reads.py
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import netCDF4
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from delft3d_flow.transect import get_transect
+from utils import get_raster_regridder
+
+N_X, N_Y = 400, 250
+CELL_SIZE = 50.
+N_TIMES = 100
+N_LAYERS = 10
+TIME_CHUNK = 24
+
+
+def write_map_file(file_path: str, shuffled: bool) -> None:
+    x_grid, y_grid = np.meshgrid(np.arange(N_X) * CELL_SIZE, np.arange(N_Y) * CELL_SIZE)
+    order = np.random.default_rng(0).permutation(N_X * N_Y) if shuffled else np.arange(N_X * N_Y)
+    face_x = x_grid.ravel()[order]
+    face_y = y_grid.ravel()[order]
+    with netCDF4.Dataset(file_path, 'w') as nc:
+        nc.createDimension('time', N_TIMES)
+        nc.createDimension('mesh2d_nFaces', N_X * N_Y)
+        nc.createDimension('mesh2d_nLayers', N_LAYERS)
+        nc.createVariable('mesh2d_face_x', 'f8', ('mesh2d_nFaces',))[:] = face_x
+        nc.createVariable('mesh2d_face_y', 'f8', ('mesh2d_nFaces',))[:] = face_y
+        temperature = nc.createVariable('mesh2d_tem1', 'f4', ('time', 'mesh2d_nFaces', 'mesh2d_nLayers'))
+        for step in range(N_TIMES):
+            temperature[step] = (face_x[:, None] / 1000 + step * 0.01 + np.arange(N_LAYERS)).astype('f4')
+
+
+def read_box_slice(interpolator, nc_variable, index: list) -> np.ndarray:
+    # Implementation before the fix: every face between the first and the last used one
+    cells = interpolator.cells
+    index[1] = slice(int(cells[0]), int(cells[-1]) + 1)
+
+    return nc_variable[tuple(index)][:, cells - cells[0]]
+
+
+def read_integer_array(interpolator, nc_variable, index: list) -> np.ndarray:
+    index[1] = interpolator.cells
+
+    return nc_variable[tuple(index)]
+
+
+def read_runs(interpolator, nc_variable, index: list) -> np.ndarray:
+    return interpolator.read_box(nc_variable, index, 1)
+
+
+def interpolate_file(file_path: str, interpolator, layer, read) -> np.ndarray:
+    with netCDF4.Dataset(file_path) as nc:
+        nc_variable = nc.variables['mesh2d_tem1']
+        results = []
+        for first_step in range(0, N_TIMES, TIME_CHUNK):
+            index = [slice(first_step, first_step + TIME_CHUNK), slice(None), layer]
+            values = np.ma.filled(np.ma.asarray(read(interpolator, nc_variable, index), dtype='float64'), np.nan)
+            results.append(interpolator.interpolate(values, cell_axis=1, in_box=True))
+
+    return np.concatenate(results)
+
+
+def measure(function) -> tuple[float, float, np.ndarray]:
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+
+    return min(timings), peak, result
+
+
+if __name__ == '__main__':
+    reads = {'box slice': read_box_slice, 'integer array': read_integer_array, 'runs (read_box)': read_runs}
+    with tempfile.TemporaryDirectory() as folder_path:
+        for shuffled in (False, True):
+            file_path = os.path.join(folder_path, f'map_{shuffled}.nc')
+            write_map_file(file_path, shuffled)
+            with netCDF4.Dataset(file_path) as nc:
+                face_x = nc.variables['mesh2d_face_x'][:]
+                face_y = nc.variables['mesh2d_face_y'][:]
+            targets = {
+                'raster, one layer': (get_raster_regridder(face_x, face_y, (2000, 4000, 3000, 5000), 100.), 3),
+                'transect, all layers': (get_transect(face_x, face_y, [[1000, 1000], [15000, 11000]],
+                                                      mask_zero=False), slice(None))
+            }
+            print(f"{'shuffled' if shuffled else 'mesh-ordered'} faces, {N_X * N_Y} faces x {N_TIMES} times "
+                  f"x {N_LAYERS} layers")
+            for target_name, (interpolator, layer) in targets.items():
+                results = []
+                for read_name, read in reads.items():
+                    elapsed, peak, result = measure(lambda: interpolate_file(file_path, interpolator, layer, read))
+                    results.append(result)
+                    print(f"  {target_name:22s} {read_name:16s} {elapsed:.2f} s, peak {peak:.0f} MB")
+                print("  identical values:", all(np.array_equal(results[0], result, equal_nan=True)
+                                               for result in results[1:]))
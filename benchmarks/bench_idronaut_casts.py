@@ -0,0 +1,73 @@
+# Benchmark of datalakes' batched Idronaut regridding (parse_idronaut_casts) against the per-cast implementation
+# it replaced, on a year of synthetic casts. Run from anywhere: python benchmarks/bench_idronaut_casts.py
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+import xarray as xr
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from datalakes.get_data_datalake import (IDRONAUT_DEPTH_ARRAY,
+                                         parse_idronaut_casts)
+
+
+def make_casts(n_casts: int = 365, seed: int = 1) -> list[dict]:
+    # One cast a day of 500 to 1500 samples, with repeated depths as the profiler produces them
+    rng = np.random.default_rng(seed)
+    casts = []
+    for day in range(n_casts):
+        n_samples = int(rng.integers(500, 1500))
+        depths = np.round(np.cumsum(rng.uniform(0.03, 0.08, n_samples)), 3)
+        depths[0:-1:50] = depths[1::50]
+        casts.append({'x': (10 + rng.random(n_samples)).tolist(), 'y': np.sort(depths).tolist(),
+                      'M': [1.7e9 + 86400 * day + 0.5]})
+
+    return casts
+
+
+def baseline_handle_duplicates(json_data) -> list:
+    adjusted_y = []
+    seen = defaultdict(int)
+    for val in json_data:
+        adjusted_y.append(val if seen[val] == 0 else val + 0.01 * seen[val])
+        seen[val] += 1
+
+    return adjusted_y
+
+
+def baseline_parse_from_idronaut(json_data, depth_array: np.array) -> xr.Dataset:
+    # Implementation before the batched regridding, kept as the reference
+    temp_data = np.array(json_data['x'], dtype='float')[:, np.newaxis]
+    depth_data = -1 * np.array(baseline_handle_duplicates(json_data['y']), dtype='float')
+    json_time = np.array([datetime.utcfromtimestamp(json_data['M'][0])])
+    raw_meas_data = xr.Dataset({'temp': (['depth', 'time'], temp_data)},
+                               coords={'time': json_time, 'depth': depth_data})
+
+    return xr.Dataset(
+        {
+            'temp': (['depth', 'time'], raw_meas_data['temp'].sel(depth=depth_array, method='nearest').values)
+        },
+        coords={
+            'time': json_time,
+            'depth': depth_array
+        }
+    )
+
+
+if __name__ == '__main__':
+    casts = make_casts()
+    start = time.perf_counter()
+    expected = xr.merge([baseline_parse_from_idronaut(json_data, IDRONAUT_DEPTH_ARRAY) for json_data in casts])
+    baseline_time = time.perf_counter() - start
+    start = time.perf_counter()
+    result = parse_idronaut_casts(casts, IDRONAUT_DEPTH_ARRAY)
+    current_time = time.perf_counter() - start
+
+    print(f"{len(casts)} casts onto {len(IDRONAUT_DEPTH_ARRAY)} depths")
+    print(f"baseline (per cast + xr.merge)  {baseline_time:.2f} s")
+    print(f"current (parse_idronaut_casts)  {current_time:.2f} s")
+    print("identical values:", np.array_equal(expected['time'].values, result['time'].values)
+          and np.array_equal(expected['temp'].sel(depth=result['depth']).values, result['temp'].values, equal_nan=True))
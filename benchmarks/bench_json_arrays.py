@@ -0,0 +1,64 @@
+# Benchmark of the Datalakes JSON decoding (decode_datalakes_json) against the response.json() + np.array path it
+# replaced, on a synthetic ADCP payload. Run from anywhere: python benchmarks/bench_json_arrays.py
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from datalakes.get_data_datalake import (decode_datalakes_json,
+                                         parse_from_adcp)
+
+ADCP_DEPTH_ARRAY = -np.array(range(10, 120))
+
+
+def make_adcp_payload(n_depths: int = 110, n_times: int = 20000, seed: int = 0) -> bytes:
+    # Same layout as a Datalakes ADCP file: x (times), y (depths), z and z1 (depth x time), with some nulls
+    rng = np.random.default_rng(seed)
+    z = np.round(rng.normal(size=(n_depths, n_times)), 4)
+    z[0, ::7] = np.nan
+    z1 = np.round(rng.normal(size=(n_depths, n_times)), 4)
+
+    def to_json_rows(values: np.ndarray) -> list:
+        return [[None if np.isnan(value) else value for value in row] for row in values.tolist()]
+
+    return json.dumps({
+        'x': (1.7e9 + np.arange(n_times) * 60).astype(int).tolist(),
+        'y': np.arange(10, 10 + n_depths).astype(float).tolist(),
+        'z': to_json_rows(z),
+        'z1': to_json_rows(z1)
+    }).encode()
+
+
+def measure(function) -> tuple[float, float, object]:
+    # (seconds, peak MB, result). Timed without tracemalloc, which slows down the allocation of Python objects
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+
+    return elapsed, peak, result
+
+
+if __name__ == '__main__':
+    payload = make_adcp_payload()
+    print(f"payload {len(payload) / 1e6:.0f} MB")
+    runs = {
+        'baseline (json.loads + np.array)': lambda: parse_from_adcp(json.loads(payload), ADCP_DEPTH_ARRAY),
+        'current (decode_datalakes_json)': lambda: parse_from_adcp(decode_datalakes_json(payload), ADCP_DEPTH_ARRAY),
+        'current, dtype=float32': lambda: parse_from_adcp(decode_datalakes_json(payload, 'float32'),
+                                                          ADCP_DEPTH_ARRAY, 'float32')
+    }
+    results = {}
+    for name, function in runs.items():
+        elapsed, peak, results[name] = measure(function)
+        print(f"{name:<34} {elapsed:.2f} s, peak {peak:.0f} MB")
+
+    expected, result = list(results.values())[:2]
+    print("identical values:", expected.identical(result))
@@ -2,5 +2,7 @@ from .get_data_datalake import (parse_nc_datalakes_from_folder,
                                 datalakes_select_from_depth,
                                 datalakes_select_profile,
                                 download_data_from_datalakes_dataset,
+                                download_datalakes_dataset_to_zarr,
                                 download_and_parse_from_json_file,
                                 download_and_parse_from_nc_file)
+from .sync_datalakes import sync_datalakes_dataset
\ No newline at end of file
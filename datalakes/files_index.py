@@ -0,0 +1,79 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils import (try_download,
+                   open_json,
+                   save_json,
+                   to_utc_datetime64)
+
+DATALAKES_FILES_URL = 'https://api.datalakes-eawag.ch/files?datasets_id={dataset_id}'
+MIN_DATETIME = np.datetime64('1678-01-01', 'ns')
+MAX_DATETIME = np.datetime64('2262-01-01', 'ns')
+
+
+def get_files_properties(dataset_id: int, cache_folder: str = None, max_age: float = 3600,
+                         use_cache: bool = True) -> list[dict]:
+    # Metadata of the files of a Datalakes dataset, cached in cache_folder for max_age seconds.
+    # use_cache=False also bypasses the response cache of try_download.
+    cache_path = os.path.join(cache_folder, f'files_{dataset_id}.json') if cache_folder is not None else None
+    if cache_path is not None and os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < max_age:
+        return open_json(cache_path)
+
+    files_properties = try_download(DATALAKES_FILES_URL.format(dataset_id=dataset_id), use_cache=use_cache).json()
+    if cache_path is not None:
+        save_json(files_properties, cache_path)
+
+    return files_properties
+
+
+class DatalakesFilesIndex:
+    def __init__(self, files_properties: list[dict]):
+        self.files_properties = files_properties
+        self.ids = np.array([file['id'] for file in files_properties], dtype=np.int64)
+        self.filetypes = np.array([file['filetype'] for file in files_properties], dtype=object)
+        min_dates = pd.to_datetime([file['mindatetime'] for file in files_properties], utc=True, format='ISO8601')
+        max_dates = pd.to_datetime([file['maxdatetime'] for file in files_properties], utc=True, format='ISO8601')
+        self.min_dates = min_dates.tz_convert(None).to_numpy(dtype='datetime64[ns]')
+        self.max_dates = max_dates.tz_convert(None).to_numpy(dtype='datetime64[ns]')
+        self._rows_by_id = {file_id: row for row, file_id in enumerate(self.ids.tolist())}
+
+        # Files with a known time range, sorted by start date for the overlap queries
+        dated_rows = np.flatnonzero(~np.isnat(self.min_dates) & ~np.isnat(self.max_dates))
+        self._rows_by_min_date = dated_rows[np.argsort(self.min_dates[dated_rows], kind='stable')]
+        self._sorted_min_dates = self.min_dates[self._rows_by_min_date]
+        durations = self.max_dates[dated_rows] - self.min_dates[dated_rows]
+        self._max_duration = durations.max() if len(durations) else np.timedelta64(0, 'ns')
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get_file(self, file_id: int) -> dict:
+        return self.files_properties[self._rows_by_id[file_id]]
+
+    def _rows_overlapping(self, start_date: np.datetime64, end_date: np.datetime64) -> np.ndarray:
+        # A file overlaps ]start_date, end_date[ if it starts before end_date and ends after start_date.
+        # Candidates start before end_date and no earlier than the longest file before start_date,
+        # both bounds are found by binary search. The lower bound is clamped to MIN_DATETIME before subtracting,
+        # start_date - max_duration would wrap around int64 for start dates close to it.
+        lower_bound = (start_date - self._max_duration if start_date - MIN_DATETIME > self._max_duration
+                       else MIN_DATETIME)
+        first_candidate = np.searchsorted(self._sorted_min_dates, lower_bound, side='left')
+        last_candidate = np.searchsorted(self._sorted_min_dates, end_date, side='left')
+        candidates = self._rows_by_min_date[first_candidate:last_candidate]
+
+        return candidates[self.max_dates[candidates] > start_date]
+
+    def query(self, start_date=None, end_date=None, filetype: str = None) -> np.ndarray:
+        # Ids of the matching files, sorted by start date when a time window is given
+        if start_date is None and end_date is None:
+            rows = np.arange(len(self.ids))
+        else:
+            rows = self._rows_overlapping(to_utc_datetime64(start_date) if start_date is not None else MIN_DATETIME,
+                                          to_utc_datetime64(end_date) if end_date is not None else MAX_DATETIME)
+        if filetype is not None:
+            rows = rows[self.filetypes[rows] == filetype]
+
+        return self.ids[rows]
@@ -3,23 +3,69 @@ import os
 
 import xarray as xr
 import numpy as np
+import pandas as pd
 import json
 
-from collections import defaultdict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import sys
 parent_dir = os.path.abspath(os.path.join(os.getcwd(), ".."))
 sys.path.append(parent_dir)
-from utils import try_download
-
-
-def parse_nc_datalakes_from_folder(folder_path: str) -> xr.Dataset:
-    nc_files = [os.path.join(folder_path, file) for file in os.listdir(folder_path) if file.endswith('.nc')]
-
-    if not nc_files:
+from utils import (try_download,
+                   download_to_file,
+                   decode_json_with_arrays,
+                   to_utc_datetime64,
+                   sorted_unique_time_order)
+from .files_index import (DatalakesFilesIndex,
+                          get_files_properties)
+from .nc_folder_index import (get_nc_folder_index,
+                              select_nc_files)
+
+IDRONAUT_DEPTH_ARRAY = -0.1 * np.array(range(0, 600))
+IDRONAUT_CASTS_PER_BLOCK = 100
+
+
+def parse_nc_datalakes_from_folder(folder_path: str, start_time: datetime = None, end_time: datetime = None,
+                                   min_depth: float = None, max_depth: float = None, chunks: dict = None,
+                                   parallel: bool = True, cache_folder: str = None) -> xr.Dataset:
+    index = get_nc_folder_index(folder_path, cache_folder)
+    if not index:
         raise FileNotFoundError(f"No NetCDF files found in directory {folder_path}")
 
-    combined_dataset = xr.open_mfdataset(nc_files, combine='by_coords')
+    start_time = to_utc_datetime64(start_time) if start_time is not None else None
+    end_time = to_utc_datetime64(end_time) if end_time is not None else None
+    nc_files = select_nc_files(index, start_time, end_time, min_depth, max_depth)
+    if not nc_files:
+        raise FileNotFoundError(f"No NetCDF files between {start_time} and {end_time} and depths {min_depth} and "
+                                f"{max_depth} found in directory {folder_path}")
+    nc_paths = [os.path.join(folder_path, file_name) for file_name in nc_files]
+
+    if all('time' in index[file_name]['dims'] for file_name in nc_files):
+        # Files are already ordered by the index: concatenate along time without inferring the order from coords
+        combined_dataset = xr.open_mfdataset(nc_paths, engine='netcdf4', combine='nested', concat_dim='time',
+                                             join='outer', data_vars='minimal', coords='minimal', compat='override',
+                                             chunks=chunks if chunks is not None else {}, parallel=parallel)
+    else:
+        combined_dataset = xr.open_mfdataset(nc_paths, engine='netcdf4', combine='by_coords', chunks=chunks,
+                                             parallel=parallel)
+
+    if 'time' in combined_dataset.coords and (start_time is not None or end_time is not None):
+        times = combined_dataset['time'].values
+        in_window = np.ones(len(times), dtype=bool)
+        if start_time is not None:
+            in_window &= times >= start_time
+        if end_time is not None:
+            in_window &= times <= end_time
+        combined_dataset = combined_dataset.isel(time=np.flatnonzero(in_window))
+    if 'depth' in combined_dataset.coords and (min_depth is not None or max_depth is not None):
+        depths = combined_dataset['depth'].values
+        in_window = np.ones(len(depths), dtype=bool)
+        if min_depth is not None:
+            in_window &= depths >= min_depth
+        if max_depth is not None:
+            in_window &= depths <= max_depth
+        combined_dataset = combined_dataset.isel(depth=np.flatnonzero(in_window))
 
     return combined_dataset
 
@@ -37,18 +83,7 @@ def datalakes_select_profile(dataset: xr.Dataset, variable: str, given_time: dat
 
 
 def get_ids_files_filtered_by_dates(files_properties, start_date: datetime, end_date: datetime) -> list[int]:
-    file_ids = []
-    for file in files_properties:
-        if file['mindatetime'] is None or file['maxdatetime'] is None:
-            continue
-        min_date = datetime.fromisoformat(file['mindatetime'].replace('Z', '+00:00'))
-        max_date = datetime.fromisoformat(file['maxdatetime'].replace('Z', '+00:00'))
-        if min_date > start_date and min_date < end_date:
-            file_ids.append(file['id'])
-            continue
-        if max_date < end_date and max_date > start_date:
-            file_ids.append(file['id'])
-            continue
+    file_ids = DatalakesFilesIndex(files_properties).query(start_date, end_date).tolist()
 
     if len(file_ids) == 0:
         raise FileNotFoundError(f"No data between date {start_date} and {end_date} found in {files_properties}")
@@ -57,10 +92,7 @@ def get_ids_files_filtered_by_dates(files_properties, start_date: datetime, end_
 
 
 def get_ids_files_filtered_by_datatype(files_properties: json, datatype: str) -> list[int]:
-    file_ids = []
-    for file in files_properties:
-        if file['filetype'] == datatype:
-            file_ids.append(file['id'])
+    file_ids = DatalakesFilesIndex(files_properties).query(filetype=datatype).tolist()
 
     if len(file_ids) == 0:
         raise FileNotFoundError(f"No data of type {datatype} found in {files_properties}")
@@ -68,13 +100,17 @@ def get_ids_files_filtered_by_datatype(files_properties: json, datatype: str) ->
     return file_ids
 
 
-def parse_from_thermochain(json_data: json):
+def seconds_to_datetime64(seconds) -> np.ndarray:
+    return np.asarray(seconds, dtype='float64').astype('int64').astype('datetime64[s]').astype('datetime64[ns]')
+
+
+def parse_from_thermochain(json_data: json, dtype: str = 'float'):
     meas_data = xr.Dataset(
         {
-            'temp': (['depth', 'time'], np.array(json_data['z'], dtype='float'))
+            'temp': (['depth', 'time'], np.asarray(json_data['z'], dtype=dtype))
         },
         coords={
-            'time': np.array(json_data['x'], dtype='datetime64[s]').astype('datetime64[ns]'),
+            'time': seconds_to_datetime64(json_data['x']),
             'depth': -1 * np.array(json_data['y'], dtype='float')
         }
     )
@@ -82,63 +118,92 @@ def parse_from_thermochain(json_data: json):
     return meas_data
 
 
-def handle_duplicates(json_data: json):
-    adjusted_y = []
-    seen = defaultdict(int)
-
-    for val in json_data:
-        if seen[val] == 0:
-            adjusted_y.append(val)
-        else:
-            # Add 0.01 * number of times this value has already appeared
-            adjusted_val = val + 0.01 * seen[val]
-            adjusted_y.append(adjusted_val)
-        seen[val] += 1
-
-    return adjusted_y
-
-
-def parse_from_idronaut(json_data, depth_array: np.array):
-    temp_data = np.array(json_data['x'], dtype='float')
-
-    cleaned_depth = handle_duplicates(json_data['y'])
-    depth_data = -1 * np.array(cleaned_depth, dtype='float')
-    json_time = np.array([datetime.utcfromtimestamp(json_data['M'][0])])  # Wrap in an array
-
-    # Ensure the temp_data shape matches depth x time
-    if temp_data.ndim == 1:  # If temp_data is 1D
-        temp_data = temp_data[:, np.newaxis]  # Add a second dimension for 'time'
-
-    # Build the dataset
-    raw_meas_data = xr.Dataset(
-        {
-            'temp': (['depth', 'time'], temp_data)
-        },
-        coords={
-            'time': json_time,
-            'depth': depth_data
-        }
-    )
-
-    interp_meas_data = xr.Dataset(
+def handle_duplicates(json_data: json) -> np.ndarray:
+    # Add 0.01 * number of times a value has already appeared, vectorized with a stable sort:
+    # the rank of each value inside its run of equal values is its number of previous occurrences
+    values = np.asarray(json_data, dtype='float')
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    run_starts = np.empty(len(values), dtype=bool)
+    run_starts[:1] = True
+    run_starts[1:] = sorted_values[1:] != sorted_values[:-1]
+    positions = np.arange(len(values))
+    first_of_run = np.maximum.accumulate(np.where(run_starts, positions, 0))
+    seen = np.empty(len(values), dtype=int)
+    seen[order] = positions - first_of_run
+
+    return values + 0.01 * seen
+
+
+def regrid_casts_nearest(cast_depths: list[np.ndarray], cast_values: list[np.ndarray],
+                         depth_array: np.ndarray) -> np.ndarray:
+    # Nearest-depth regridding of all casts at once, returns a (depth_array, cast) array.
+    # Casts are laid end to end on one sorted key (cast offset + depth) so that a single
+    # searchsorted call finds the neighbours of every target depth in every cast.
+    depth_array = np.asarray(depth_array, dtype='float')
+    n_casts = len(cast_depths)
+    lengths = np.array([len(depths) for depths in cast_depths])
+    regridded = np.full((len(depth_array), n_casts), np.nan)
+    if lengths.sum() == 0 or len(depth_array) == 0:
+        return regridded
+
+    cast_index = np.repeat(np.arange(n_casts), lengths)
+    depths = np.concatenate(cast_depths).astype('float')
+    values = np.concatenate(cast_values).astype('float')
+    order = np.lexsort((depths, cast_index))
+    depths = depths[order]
+    values = values[order]
+
+    min_depth = min(depths.min(), depth_array.min())
+    span = max(depths.max(), depth_array.max()) - min_depth + 1
+    keys = cast_index * span + (depths - min_depth)
+    cast_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    cast_ends = cast_starts + lengths - 1
+
+    valid_casts = np.flatnonzero(lengths > 0)
+    target_keys = valid_casts[:, np.newaxis] * span + (depth_array - min_depth)[np.newaxis, :]
+    positions = np.searchsorted(keys, target_keys)
+    starts = cast_starts[valid_casts][:, np.newaxis]
+    ends = cast_ends[valid_casts][:, np.newaxis]
+    left = np.clip(positions - 1, starts, ends)
+    right = np.clip(positions, starts, ends)
+    left_is_closer = np.abs(depths[left] - depth_array) < np.abs(depths[right] - depth_array)
+    nearest = np.where(left_is_closer, left, right)
+    regridded[:, valid_casts] = values[nearest].T
+
+    return regridded
+
+
+def parse_idronaut_casts(json_casts: list, depth_array: np.array) -> xr.Dataset:
+    cast_values = [np.asarray(json_data['x'], dtype='float').ravel() for json_data in json_casts]
+    cast_depths = [-1 * handle_duplicates(json_data['y']) for json_data in json_casts]
+    cast_times = np.array([json_data['M'][0] for json_data in json_casts], dtype='float')
+    cast_times = pd.to_datetime(cast_times, unit='s').values
+
+    # Preallocated depth x time output, filled in one pass for all casts
+    meas_data = xr.Dataset(
         {
-            'temp': (['depth', 'time'], raw_meas_data['temp'].sel(depth=depth_array, method='nearest').values)
+            'temp': (['depth', 'time'], regrid_casts_nearest(cast_depths, cast_values, depth_array))
         },
         coords={
-            'time': json_time,
+            'time': cast_times,
             'depth': depth_array
         }
     )
 
-    return interp_meas_data
+    return sort_and_drop_duplicate_times(meas_data)
 
 
-def parse_from_adcp(json_data: json, depth_array: np.array):
-    json_time = np.array(json_data['x'], dtype='datetime64[s]').astype('datetime64[ns]')
+def parse_from_idronaut(json_data, depth_array: np.array):
+    return parse_idronaut_casts([json_data], depth_array)
+
+
+def parse_from_adcp(json_data: json, depth_array: np.array, dtype: str = 'float'):
+    json_time = seconds_to_datetime64(json_data['x'])
     raw_meas_data = xr.Dataset(
         {
-            'u': (['depth', 'time'], np.array(json_data['z'], dtype='float')),
-            'v': (['depth', 'time'], np.array(json_data['z1'], dtype='float'))
+            'u': (['depth', 'time'], np.asarray(json_data['z'], dtype=dtype)),
+            'v': (['depth', 'time'], np.asarray(json_data['z1'], dtype=dtype))
         },
         coords={
             'time': json_time,
@@ -160,64 +225,221 @@ def parse_from_adcp(json_data: json, depth_array: np.array):
     return interp_meas_data
 
 
-def download_and_parse_from_json_file(file_id: int, dataset_type: str) -> xr.Dataset:
-    response = try_download(f'https://api.datalakes-eawag.ch/download/{file_id}')
-    json_meas = response.json()
-
+def parse_json_file(json_meas: json, dataset_type: str, dtype: str = 'float') -> xr.Dataset:
     if dataset_type == 'thermochain':
-        meas_data = parse_from_thermochain(json_meas)
+        meas_data = parse_from_thermochain(json_meas, dtype)
     elif dataset_type == 'idronaut':
-        depth_array = -0.1 * np.array(range(0, 600))
-        meas_data = parse_from_idronaut(json_meas, depth_array)
+        meas_data = parse_from_idronaut(json_meas, IDRONAUT_DEPTH_ARRAY)
     elif dataset_type == 'adcp_deep_velocity':
         depth_array = -np.array(range(10, 120))
-        meas_data = parse_from_adcp(json_meas, depth_array)
+        meas_data = parse_from_adcp(json_meas, depth_array, dtype)
     elif dataset_type == 'adcp_near_surface_velocity':
         depth_array = -np.arange(0, 8, 0.25)  # 0.25
-        meas_data = parse_from_adcp(json_meas, depth_array)
+        meas_data = parse_from_adcp(json_meas, depth_array, dtype)
     else:
         raise ValueError(f"Couldn't recognise dataset type {dataset_type}.")
 
     return meas_data
 
 
-def download_and_parse_from_nc_file(file_id: int, temp_folder: str) -> xr.Dataset:
+def decode_datalakes_json(payload: bytes, dtype: str = 'float') -> json:
+    # The dense x, y, z, z1 arrays are decoded straight into numpy arrays
+    return decode_json_with_arrays(payload, {'x': 'float64', 'y': 'float64', 'z': dtype, 'z1': dtype})
+
+
+def download_and_parse_from_json_file(file_id: int, dataset_type: str, dtype: str = 'float') -> xr.Dataset:
     response = try_download(f'https://api.datalakes-eawag.ch/download/{file_id}')
 
+    return parse_json_file(decode_datalakes_json(response.content, dtype), dataset_type, dtype)
+
+
+def download_and_parse_from_nc_file(file_id: int, temp_folder: str, expected_size: int = None,
+                                    sha256: str = None) -> xr.Dataset:
     temp_file_path = os.path.join(temp_folder, f"data_{file_id}.nc")
-    with open(temp_file_path, "wb") as file:
-        file.write(response.content)
+    download_to_file(f'https://api.datalakes-eawag.ch/download/{file_id}', temp_file_path,
+                     expected_size=expected_size, sha256=sha256)
 
-    meas_data = xr.open_dataset(temp_file_path, engine="netcdf4")
+    # Lazy open: values are only read from disk when the dataset is computed
+    meas_data = xr.open_dataset(temp_file_path, engine="netcdf4", chunks={})
 
     return meas_data[['u', 'v']]
 
 
-def download_data_from_datalakes_dataset(dataset_id: int, start_date: datetime, end_date: datetime,
-                                         dataset_type: str = "thermochain", datatype: str = "json",
-                                         temp_folder: str = "./temp") :
-    response = try_download(f'https://api.datalakes-eawag.ch/files?datasets_id={dataset_id}')
-    files_properties = response.json()
+def download_and_parse_file(file_id: int, dataset_type: str, datatype: str, temp_folder: str,
+                            dtype: str = 'float') -> xr.Dataset:
+    if datatype == "json":
+        meas_data: xr.Dataset = download_and_parse_from_json_file(file_id, dataset_type, dtype)
+    elif datatype == "nc":
+        meas_data: xr.Dataset = download_and_parse_from_nc_file(file_id, temp_folder)
+        depth_array = np.arange(-2.05, 7.8, 0.25)
+        meas_data = meas_data.interp(depth=depth_array)
+    else:
+        raise ValueError(f"Unrecognised datatype {datatype}. Must be either json or nc.")
 
-    file_ids: list[int] = get_ids_files_filtered_by_datatype(files_properties, datatype)
+    return meas_data
 
-    if datatype == "json":
-        ids_filtered_by_date: list[int] = get_ids_files_filtered_by_dates(files_properties, start_date, end_date)
-        file_ids = [file_id for file_id in file_ids if file_id in ids_filtered_by_date]
 
-    datasets = []
+def iter_bounded_map(function, items: list, max_workers: int = 8):
+    # Runs function on the items concurrently, yields the results in the order of items.
+    # At most 2 * max_workers results are held in memory at once.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_parsed_files(file_ids: list[int], dataset_type: str, datatype: str, temp_folder: str,
+                      max_workers: int = 8, dtype: str = 'float'):
+    # Downloads and parses files concurrently, yields the datasets in the order of file_ids
+    yield from iter_bounded_map(lambda file_id: download_and_parse_file(file_id, dataset_type, datatype,
+                                                                        temp_folder, dtype),
+                                file_ids, max_workers)
+
+
+def iter_idronaut_blocks(file_ids: list[int], max_workers: int = 8, dtype: str = 'float',
+                         casts_per_block: int = IDRONAUT_CASTS_PER_BLOCK):
+    # Casts are downloaded and decoded concurrently, and regridded casts_per_block at a time into a single
+    # depth x time dataset: at most one block of decoded casts is held in memory.
+    casts = iter_bounded_map(lambda file_id: decode_datalakes_json(
+        try_download(f'https://api.datalakes-eawag.ch/download/{file_id}').content, dtype), file_ids, max_workers)
+    json_casts = []
+    for json_data in casts:
+        json_casts.append(json_data)
+        if len(json_casts) == casts_per_block:
+            yield parse_idronaut_casts(json_casts, IDRONAUT_DEPTH_ARRAY)
+            json_casts = []
+    if json_casts:
+        yield parse_idronaut_casts(json_casts, IDRONAUT_DEPTH_ARRAY)
+
+
+def sort_and_drop_duplicate_times(dataset: xr.Dataset) -> xr.Dataset:
+    return dataset.isel(time=sorted_unique_time_order(dataset['time'].values))
+
+
+def concat_datalakes_datasets(datasets: list[xr.Dataset]) -> xr.Dataset:
+    # One concatenation along time, instead of aligning every dataset against the others with xr.merge
+    combined = xr.concat(datasets, dim='time', join='outer', data_vars='minimal', coords='minimal',
+                         compat='override')
+
+    return sort_and_drop_duplicate_times(combined)
+
+
+def _on_store_depths(meas_data: xr.Dataset, target_path: str, depth_array: np.ndarray) -> xr.Dataset:
+    # The store keeps the depth axis it was created with: files missing some of its depths get NaN there, as
+    # with the outer join in memory, but a file with other depths can't be written to it.
+    extra_depths = np.setdiff1d(meas_data['depth'].values, depth_array)
+    if len(extra_depths):
+        raise ValueError(f"Depths {extra_depths.tolist()} are not in the depth axis of {target_path} "
+                         f"({depth_array.tolist()}), the files can't be appended to a single store")
+
+    return sort_and_drop_duplicate_times(meas_data.reindex(depth=depth_array))
+
+
+def append_to_zarr(meas_data: xr.Dataset, target_path: str, depth_array: np.ndarray,
+                   last_time: np.datetime64) -> np.datetime64:
+    # Files are processed chronologically: only times after the last written one are appended.
+    meas_data = _on_store_depths(meas_data, target_path, depth_array)
+    if last_time is not None:
+        meas_data = meas_data.isel(time=np.flatnonzero(meas_data['time'].values > last_time))
+    if meas_data.sizes['time'] == 0:
+        return last_time
+
+    for variable in meas_data.variables.values():
+        variable.encoding = {}
+    if last_time is None:
+        meas_data.to_zarr(target_path, mode='w')
+    else:
+        meas_data.to_zarr(target_path, append_dim='time')
+
+    return meas_data['time'].values[-1]
+
+
+def overwrite_in_zarr(meas_data: xr.Dataset, target_path: str, depth_array: np.ndarray) -> bool:
+    # Writes meas_data over the times it shares with the store, rewriting only the time range between the first
+    # and last of them. Returns False if some of its times are not in the store: they can't be inserted between
+    # the stored ones without rebuilding it.
+    meas_data = _on_store_depths(meas_data, target_path, depth_array)
+    times = meas_data['time'].values
+    with xr.open_zarr(target_path) as stored_data:
+        stored_times = stored_data['time'].values
+        positions = np.searchsorted(stored_times, times)
+        stored = positions < len(stored_times)
+        stored[stored] = stored_times[positions[stored]] == times[stored]
+        if not stored.any():
+            return len(times) == 0
+        positions = positions[stored]
+        region = slice(int(positions[0]), int(positions[-1]) + 1)
+        block = stored_data[list(meas_data.data_vars)].isel(time=region).load()
+
+    meas_data = meas_data.isel(time=np.flatnonzero(stored))
+    for name, variable in meas_data.data_vars.items():
+        values = np.array(block[name].values)
+        index = [slice(None)] * values.ndim
+        index[block[name].dims.index('time')] = positions - region.start
+        values[tuple(index)] = variable.transpose(*block[name].dims).values
+        block[name] = block[name].copy(data=values)
+    block = block.drop_vars([name for name in block.coords if 'time' not in block[name].dims])
+    for variable in block.variables.values():
+        variable.encoding = {}
+    block.to_zarr(target_path, region={'time': region})
+
+    return bool(stored.all())
+
+
+def iter_dataset_blocks(dataset_id: int, start_date: datetime, end_date: datetime,
+                        dataset_type: str = "thermochain", datatype: str = "json", temp_folder: str = "./temp",
+                        files_cache_max_age: float = 3600, max_workers: int = 8, dtype: str = 'float'):
+    # Parsed datasets of the files of the dataset between start_date and end_date, in chronological order
     os.makedirs(temp_folder, exist_ok=True)
-    depth_profile = None
-    for file_id in file_ids:
-        if datatype == "json":
-            meas_data: xr.Dataset = download_and_parse_from_json_file(file_id, dataset_type)
-        elif datatype == "nc":
-            meas_data: xr.Dataset = download_and_parse_from_nc_file(file_id, temp_folder)
-            depth_array = np.arange(-2.05, 7.8, 0.25)
-            meas_data = meas_data.interp(depth=depth_array)
-        else:
-            raise ValueError(f"Unrecognised datatype {datatype}. Must be either json or nc.")
-
-        datasets.append(meas_data)
-
-    return (datasets, xr.merge(datasets))
+    files_index = DatalakesFilesIndex(get_files_properties(dataset_id, temp_folder, files_cache_max_age))
+
+    if datatype == "json":
+        file_ids: list[int] = files_index.query(start_date, end_date, filetype=datatype).tolist()
+    else:
+        file_ids: list[int] = files_index.query(filetype=datatype).tolist()
+
+    if len(file_ids) == 0:
+        raise FileNotFoundError(f"No data of type {datatype} between date {start_date} and {end_date} "
+                                f"found in dataset {dataset_id}")
+
+    # Chronological order, so that blocks can be appended to an on-disk target as they arrive
+    file_ids = sorted(file_ids, key=lambda file_id: files_index.get_file(file_id)['mindatetime'] or '')
+    if datatype == "json" and dataset_type == 'idronaut':
+        # One file per cast: casts are regridded by blocks instead of one at a time
+        return iter_idronaut_blocks(file_ids, max_workers, dtype)
+
+    return iter_parsed_files(file_ids, dataset_type, datatype, temp_folder, max_workers, dtype)
+
+
+def download_data_from_datalakes_dataset(dataset_id: int, start_date: datetime, end_date: datetime,
+                                         dataset_type: str = "thermochain", datatype: str = "json",
+                                         temp_folder: str = "./temp", files_cache_max_age: float = 3600,
+                                         max_workers: int = 8, dtype: str = 'float') :
+    # (parsed datasets, their concatenation along time). The datasets are one per file, or one per block of
+    # casts for idronaut profiles.
+    datasets = list(iter_dataset_blocks(dataset_id, start_date, end_date, dataset_type, datatype, temp_folder,
+                                        files_cache_max_age, max_workers, dtype))
+
+    return (datasets, concat_datalakes_datasets(datasets))
+
+
+def download_datalakes_dataset_to_zarr(dataset_id: int, start_date: datetime, end_date: datetime, target_path: str,
+                                       dataset_type: str = "thermochain", datatype: str = "json",
+                                       temp_folder: str = "./temp", files_cache_max_age: float = 3600,
+                                       max_workers: int = 8, dtype: str = 'float') -> xr.Dataset:
+    # Same data as download_data_from_datalakes_dataset, written block by block to a Zarr store on the depth axis
+    # of the first file and returned lazily from it: none are kept in memory. Files with depths outside of it
+    # raise, use download_data_from_datalakes_dataset to join them in memory instead.
+    depth_array = None
+    last_time = None
+    for meas_data in iter_dataset_blocks(dataset_id, start_date, end_date, dataset_type, datatype, temp_folder,
+                                         files_cache_max_age, max_workers, dtype):
+        if depth_array is None:
+            depth_array = meas_data['depth'].values
+        last_time = append_to_zarr(meas_data, target_path, depth_array, last_time)
+
+    return xr.open_zarr(target_path)
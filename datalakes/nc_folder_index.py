@@ -0,0 +1,82 @@
+import hashlib
+import os
+
+import numpy as np
+import xarray as xr
+
+from utils import (INDEX_CACHE_DIR,
+                   open_json,
+                   save_json)
+
+INDEX_FILE_NAME = 'nc_index_{key}.json'
+
+
+def _describe_nc_file(file_path: str) -> dict:
+    with xr.open_dataset(file_path, engine='netcdf4') as dataset:
+        description = {
+            'mtime': os.path.getmtime(file_path),
+            'variables': list(dataset.data_vars),
+            'dims': {dim: int(size) for dim, size in dataset.sizes.items()},
+            'time_range': None,
+            'depth_range': None
+        }
+        if 'time' in dataset.coords and dataset['time'].size > 0:
+            times = dataset['time'].values.astype('datetime64[ns]')
+            description['time_range'] = [str(np.nanmin(times)), str(np.nanmax(times))]
+        if 'depth' in dataset.coords and dataset['depth'].size > 0:
+            depths = dataset['depth'].values.astype(float)
+            description['depth_range'] = [float(np.nanmin(depths)), float(np.nanmax(depths))]
+
+    return description
+
+
+def get_nc_folder_index(folder_path: str, cache_folder: str = None) -> dict[str, dict]:
+    # Coordinate ranges and variables of every .nc file of the folder, cached in cache_folder (INDEX_CACHE_DIR by
+    # default). Entries are refreshed when the file mtime changes, removed files are dropped.
+    key = hashlib.sha256(os.path.abspath(folder_path).encode('utf-8')).hexdigest()[:16]
+    cache_folder = cache_folder if cache_folder is not None else INDEX_CACHE_DIR
+    index_path = os.path.join(cache_folder, INDEX_FILE_NAME.format(key=key))
+    cached_index = open_json(index_path) if os.path.exists(index_path) else {}
+
+    index = {}
+    for file_name in sorted(os.listdir(folder_path)):
+        if not file_name.endswith('.nc'):
+            continue
+        file_path = os.path.join(folder_path, file_name)
+        cached_description = cached_index.get(file_name)
+        if cached_description is not None and cached_description['mtime'] == os.path.getmtime(file_path):
+            index[file_name] = cached_description
+        else:
+            index[file_name] = _describe_nc_file(file_path)
+
+    if index != cached_index:
+        try:
+            save_json(index, index_path)
+        except OSError:
+            # Read-only cache folder: the files are described again on the next call
+            pass
+
+    return index
+
+
+def _overlaps(value_range, start, end, parse) -> bool:
+    if value_range is None:
+        return True
+    if start is not None and parse(value_range[1]) < start:
+        return False
+    if end is not None and parse(value_range[0]) > end:
+        return False
+
+    return True
+
+
+def select_nc_files(index: dict[str, dict], start_time: np.datetime64 = None, end_time: np.datetime64 = None,
+                    min_depth: float = None, max_depth: float = None) -> list[str]:
+    # File names overlapping the requested window, sorted by start time
+    selected = [
+        file_name for file_name, description in index.items()
+        if _overlaps(description['time_range'], start_time, end_time, lambda date: np.datetime64(date, 'ns'))
+        and _overlaps(description['depth_range'], min_depth, max_depth, float)
+    ]
+
+    return sorted(selected, key=lambda file_name: (index[file_name]['time_range'] or [''])[0])
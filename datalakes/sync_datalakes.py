@@ -0,0 +1,110 @@
+import hashlib
+import os
+import shutil
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+import xarray as xr
+
+from utils import (try_download,
+                   download_to_file,
+                   file_sha256,
+                   open_json,
+                   save_json,
+                   to_utc_datetime64)
+from .files_index import (DatalakesFilesIndex,
+                          get_files_properties)
+from .get_data_datalake import (parse_json_file,
+                                decode_datalakes_json,
+                                append_to_zarr,
+                                overwrite_in_zarr,
+                                iter_bounded_map)
+
+
+def _download_and_parse_with_checksum(file_id: int, dataset_type: str, datatype: str,
+                                      sync_folder: str) -> tuple[xr.Dataset, str]:
+    url = f'https://api.datalakes-eawag.ch/download/{file_id}'
+    if datatype == "json":
+        # Bypass the response cache: the point is to see whether the remote file changed
+        response = try_download(url, use_cache=False)
+        return (parse_json_file(decode_datalakes_json(response.content), dataset_type),
+                hashlib.sha256(response.content).hexdigest())
+    elif datatype == "nc":
+        file_path = os.path.join(sync_folder, 'files', f"data_{file_id}.nc")
+        download_to_file(url, file_path)
+        meas_data = xr.open_dataset(file_path, engine="netcdf4", chunks={})[['u', 'v']]
+        return meas_data.interp(depth=np.arange(-2.05, 7.8, 0.25)), file_sha256(file_path)
+    else:
+        raise ValueError(f"Unrecognised datatype {datatype}. Must be either json or nc.")
+
+
+def sync_datalakes_dataset(dataset_id: int, year: int, sync_folder: str, dataset_type: str = "thermochain",
+                           datatype: str = "json", max_workers: int = 8, rebuild: bool = False) -> xr.Dataset:
+    # Keeps {sync_folder}/{year}.zarr up to date with the Datalakes dataset. The manifest records the
+    # maxdatetime and checksum of every file already ingested: only new files, or files whose maxdatetime
+    # changed (e.g. the live file of a thermochain), are downloaded. When their checksum changed, their times
+    # after the last stored one are appended and the stored ones overwritten. New times between stored ones
+    # need rebuild=True: until then the file keeps its old manifest entry and is synced again on every run.
+    os.makedirs(sync_folder, exist_ok=True)
+    manifest_path = os.path.join(sync_folder, f'manifest_{dataset_id}_{year}.json')
+    store_path = os.path.join(sync_folder, f'{year}.zarr')
+    if rebuild:
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        shutil.rmtree(store_path, ignore_errors=True)
+    manifest = open_json(manifest_path) if os.path.exists(manifest_path) else {}
+
+    start_date = datetime(year, 1, 1, tzinfo=timezone.utc)
+    end_date = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+    # Fresh listing on every run, neither the listing file nor the response cache are reused
+    files_index = DatalakesFilesIndex(get_files_properties(dataset_id, sync_folder, max_age=0, use_cache=False))
+    if datatype == "json":
+        file_ids = files_index.query(start_date, end_date, filetype=datatype).tolist()
+    else:
+        file_ids = files_index.query(filetype=datatype).tolist()
+
+    files_to_sync = [
+        file_id for file_id in file_ids
+        if manifest.get(str(file_id), {}).get('maxdatetime') != files_index.get_file(file_id)['maxdatetime']
+    ]
+    files_to_sync.sort(key=lambda file_id: files_index.get_file(file_id)['mindatetime'] or '')
+
+    depth_array = None
+    last_time = None
+    if os.path.exists(store_path):
+        with xr.open_zarr(store_path) as stored_data:
+            depth_array = stored_data['depth'].values
+            last_time = stored_data['time'].values[-1]
+
+    year_start = to_utc_datetime64(start_date)
+    year_end = to_utc_datetime64(end_date)
+    # Files are parsed concurrently, a bounded number ahead of the one being appended
+    parsed_files = iter_bounded_map(lambda file_id: _download_and_parse_with_checksum(file_id, dataset_type,
+                                                                                      datatype, sync_folder),
+                                    files_to_sync, max_workers)
+    for file_id, (meas_data, checksum) in zip(files_to_sync, parsed_files):
+        file_entry = {'maxdatetime': files_index.get_file(file_id)['maxdatetime'], 'checksum': checksum}
+        if manifest.get(str(file_id), {}).get('checksum') != checksum:
+            times = meas_data['time'].values
+            meas_data = meas_data.isel(time=np.flatnonzero((times >= year_start) & (times < year_end)))
+            if depth_array is None and meas_data.sizes['time'] > 0:
+                depth_array = meas_data['depth'].values
+            if last_time is not None:
+                stored_data = meas_data.isel(time=np.flatnonzero(meas_data['time'].values <= last_time))
+                if stored_data.sizes['time'] > 0 and not overwrite_in_zarr(stored_data, store_path, depth_array):
+                    warnings.warn(f"File {file_id} of dataset {dataset_id} has new times between the stored ones "
+                                  f"of {store_path}, sync with rebuild=True to add them")
+                    file_entry = manifest.get(str(file_id))
+            if meas_data.sizes['time'] > 0:
+                last_time = append_to_zarr(meas_data, store_path, depth_array, last_time)
+        if file_entry is None:
+            continue
+        manifest[str(file_id)] = file_entry
+        # Saved after every file so that an interrupted sync resumes where it stopped
+        save_json(manifest, manifest_path)
+
+    if not os.path.exists(store_path):
+        raise FileNotFoundError(f"No data of type {datatype} in {year} found in dataset {dataset_id}")
+
+    return xr.open_zarr(store_path)
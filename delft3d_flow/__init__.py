@@ -1 +1,10 @@
-from .plot_functions import get_closest_index_by_coord, extract_timeseries_from_output_file_by_coordinates
\ No newline at end of file
+from .plot_functions import get_closest_index_by_coord, extract_timeseries_from_output_file_by_coordinates
+from .extract_points import (extract_stations_from_output_file,
+                             stations_from_config_points)
+from .frames import (get_frame,
+                     clear_frame_cache)
+from .raster import (get_grid_raster,
+                     XYHeatmapFigure,
+                     export_xy_heatmap_frames)
+from .transect import (get_transect,
+                       extract_transect_from_file)
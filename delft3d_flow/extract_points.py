@@ -0,0 +1,114 @@
+import json
+
+import netCDF4
+import numpy as np
+import xarray as xr
+from pyproj import Transformer
+
+from utils import (get_flow_spatial_index,
+                   SortedAxis)
+from .times import decode_flow_times
+
+FLOW_FILL_VALUE = -999
+MIN_CELLS_PER_READ = 16
+
+
+def stations_from_config_points(config_points_path: str, station_names: list[str],
+                                crs: str = 'EPSG:21781') -> dict[str, tuple[float, float]]:
+    # (x, y) of the stations of config_points.json in the model crs (CH1903 by default)
+    with open(config_points_path, 'r') as file:
+        config_points = json.load(file)
+    transformer = Transformer.from_crs("EPSG:4326", crs)
+
+    return {name: transformer.transform(config_points[name]['lat_station_wgs84'],
+                                        config_points[name]['long_station_wgs84'])
+            for name in station_names}
+
+
+def group_cells_for_reads(cells: np.ndarray) -> list[np.ndarray]:
+    # Groups (n, m) cells into contiguous boxes to read in one hyperslab each. A cell joins the current box
+    # as long as the box stays small or at most half empty, so distant stations are read separately.
+    order = np.lexsort((cells[:, 1], cells[:, 0]))
+    groups = [[order[0]]]
+    for row in order[1:]:
+        group_cells = cells[groups[-1] + [row]]
+        box_size = np.prod(group_cells.max(axis=0) - group_cells.min(axis=0) + 1)
+        if box_size <= max(MIN_CELLS_PER_READ, 2 * len(group_cells)):
+            groups[-1].append(row)
+        else:
+            groups.append([row])
+
+    return [np.array(group) for group in groups]
+
+
+def _read_cells(nc_variable, leading_index: tuple, layer_indices: np.ndarray, cells: np.ndarray,
+                groups: list[np.ndarray]) -> np.ndarray:
+    # (time, layer, cell) values of the requested layers at every cell, one hyperslab per group of cells
+    first_layer, last_layer = layer_indices.min(), layer_indices.max()
+    values = np.empty((nc_variable.shape[0], len(layer_indices), len(cells)), dtype='float64')
+    for group in groups:
+        n_min, m_min = cells[group].min(axis=0)
+        n_max, m_max = cells[group].max(axis=0)
+        block = nc_variable[(slice(None),) + tuple(leading_index)
+                            + (slice(first_layer, last_layer + 1), slice(n_min, n_max + 1), slice(m_min, m_max + 1))]
+        block = np.ma.filled(block.astype('float64'), np.nan)
+        block = block[:, layer_indices - first_layer]
+        values[:, :, group] = block[:, :, cells[group, 0] - n_min, cells[group, 1] - m_min]
+
+    values[values == FLOW_FILL_VALUE] = np.nan
+
+    return values
+
+
+def extract_stations_from_output_file(file_path: str, stations: dict[str, tuple[float, float]], depths: list[float],
+                                      variables: dict, interpolate_depth: bool = False) -> xr.Dataset:
+    # stations: {name: (x, y)} in the model crs, depths: positive downwards,
+    # variables: {output name: variable name or (variable name, leading indices)},
+    # e.g. {'temperature': ('R1', (0,)), 'u': 'U1'}. All indices are resolved once and each variable is read
+    # with a few contiguous hyperslabs for all stations and depths.
+    # With interpolate_depth, values are linearly interpolated between the two layers around each depth
+    # instead of taken from the closest layer.
+    station_names = list(stations)
+    station_coords = np.array([stations[name] for name in station_names], dtype=float)
+    cell_indices, _ = get_flow_spatial_index(file_path).query(station_coords[:, 0], station_coords[:, 1])
+    cells = np.column_stack(cell_indices)
+
+    # Cells are read once even when several stations share them
+    unique_cells, station_cells = np.unique(cells, axis=0, return_inverse=True)
+    station_cells = station_cells.ravel()
+    groups = group_cells_for_reads(unique_cells)
+
+    with netCDF4.Dataset(file_path) as nc:
+        layer_axis = SortedAxis(-np.array(nc.variables['ZK_LYR'][:], dtype=float))
+        depths = np.atleast_1d(np.asarray(depths, dtype=float))
+        if interpolate_depth:
+            lower_layers, upper_layers, upper_weights = layer_axis.bracket(depths)
+            layer_indices = np.concatenate((lower_layers, upper_layers))
+        else:
+            layer_indices = layer_axis.nearest(depths)
+        times = decode_flow_times(nc)
+        x_cells = np.array(nc.variables['XZ'][:])[cells[:, 0], cells[:, 1]]
+        y_cells = np.array(nc.variables['YZ'][:])[cells[:, 0], cells[:, 1]]
+
+        data_vars = {}
+        for output_name, variable in variables.items():
+            variable_name, leading_index = (variable, ()) if isinstance(variable, str) else variable
+            values = _read_cells(nc.variables[variable_name], leading_index, layer_indices, unique_cells, groups)
+            if interpolate_depth:
+                weights = upper_weights[np.newaxis, :, np.newaxis]
+                values = (1 - weights) * values[:, :len(depths)] + weights * values[:, len(depths):]
+            data_vars[output_name] = (['station', 'depth', 'time'], values[:, :, station_cells].transpose(2, 1, 0))
+
+    return xr.Dataset(
+        data_vars,
+        coords={
+            'station': station_names,
+            'depth': depths,
+            'time': times,
+            'layer_depth': ('depth', layer_axis.values[layer_indices[:len(depths)]]),
+            'n': ('station', cells[:, 0]),
+            'm': ('station', cells[:, 1]),
+            'x': ('station', x_cells),
+            'y': ('station', y_cells)
+        }
+    )
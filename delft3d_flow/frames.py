@@ -0,0 +1,64 @@
+import os
+from collections import OrderedDict
+
+import netCDF4
+import numpy as np
+import xarray as xr
+
+from .extract_points import FLOW_FILL_VALUE
+
+FRAME_CACHE_SIZE = 16
+
+_frame_cache = OrderedDict()
+
+
+def _read_frame(data, time_index: int) -> np.ndarray:
+    if isinstance(data, tuple):
+        # (file path, variable name[, index of the dimensions after time])
+        file_path, variable_name = data[:2]
+        with netCDF4.Dataset(file_path) as nc:
+            frame = nc.variables[variable_name][(time_index,) + tuple(data[2] if len(data) > 2 else ())]
+    elif isinstance(data, xr.DataArray):
+        frame = data.isel({data.dims[0]: time_index}).values
+    else:
+        frame = data[time_index]
+
+    frame = np.ma.filled(np.ma.asarray(frame, dtype='float64'), np.nan)
+    frame[frame == FLOW_FILL_VALUE] = np.nan
+
+    return frame
+
+
+def _frame_cache_key(data, time_index: int) -> tuple:
+    if isinstance(data, tuple):
+        file_path = os.path.abspath(data[0])
+        return (file_path, os.path.getmtime(file_path), data[1], tuple(data[2]) if len(data) > 2 else (),
+                time_index)
+
+    return id(data), time_index
+
+
+def get_frame(data, time_index: int) -> np.ndarray:
+    # Single time step of a time-first variable, read lazily from a numpy array, a netCDF4 variable,
+    # an xarray/dask DataArray or a (file path, variable name[, index]) tuple.
+    # The last FRAME_CACHE_SIZE lazily read frames are kept, so going back and forth between dates is cheap.
+    if isinstance(data, np.ndarray):
+        return data[time_index]
+
+    key = _frame_cache_key(data, time_index)
+    cached = _frame_cache.get(key)
+    # In-memory sources are keyed by id(): the cached entry also checks that it is still the same object
+    if cached is not None and (isinstance(data, tuple) or cached[0] is data):
+        _frame_cache.move_to_end(key)
+        return cached[1]
+
+    frame = _read_frame(data, time_index)
+    _frame_cache[key] = (data, frame)
+    while len(_frame_cache) > FRAME_CACHE_SIZE:
+        _frame_cache.popitem(last=False)
+
+    return frame
+
+
+def clear_frame_cache() -> None:
+    _frame_cache.clear()
@@ -1,49 +1,45 @@
 import matplotlib.pyplot as plt
 import numpy as np
-from datetime import datetime, timezone
 import netCDF4
-import pandas as pd
-import sys
+
+from utils import (get_flow_spatial_index,
+                   SortedAxis)
+from .frames import get_frame
+from .raster import XYHeatmapFigure
+from .times import (decode_flow_times,
+                    find_closest_time_index,
+                    to_datetime64_array)
 
 def get_closest_index(value, array):
-    array = np.asarray(array)
-    sorted_array = np.sort(array)
-    if len(array) == 0:
-        raise ValueError("Array must be longer than len(0) to find index of value")
-    elif len(array) == 1:
+    # array can also be a utils.SortedAxis, to sort it only once for repeated lookups
+    axis = array if isinstance(array, SortedAxis) else SortedAxis(array)
+    sorted_array = axis.sorted_values
+    if len(axis) == 1:
         return 0
     if value > (2 * sorted_array[-1] - sorted_array[-2]):
         raise ValueError("Value {} greater than max available ({})".format(value, sorted_array[-1]))
     elif value < (2 * sorted_array[0] - sorted_array[-1]):
         raise ValueError("Value {} less than min available ({})".format(value, sorted_array[0]))
-    return (np.abs(array - value)).argmin()
+    return axis.nearest(value)
 
 # %%
 def get_closest_index_by_coord(x_array, y_array, x_coor, y_coor):
-    min_distance = sys.maxsize
-    closest_index = None
-
-    # Iterate through each cell in the grid
-    for n in range(len(x_array)):
-        for m in range(len(x_array[0])):
-            # Calculate distance to the given coordinate
-            distance = (x_array[n][m] - x_coor) ** 2 + (y_array[n][m] - y_coor) ** 2
-            if distance < min_distance:
-                min_distance = distance
-                closest_index = (n, m)
+    # Repeated lookups on the grid of a file should use utils.get_flow_spatial_index instead
+    distances = (np.asarray(x_array, dtype=float) - x_coor) ** 2 + (np.asarray(y_array, dtype=float) - y_coor) ** 2
+    closest_index = np.unravel_index(np.nanargmin(distances), distances.shape)
 
-    return closest_index
+    return tuple(int(index) for index in closest_index)
 
 # %%
 def extract_data_from_output_file(file_path, variable, pattern, depth=1):
+    pattern = list(pattern)
     with netCDF4.Dataset(file_path) as nc:
-        times = np.array(nc.variables["time"][:])
+        timestamps = decode_flow_times(nc)
         if str(pattern[-3]) == "get_depth_index_from_depth":
             depth_index = get_closest_index(depth, np.array(nc.variables["ZK_LYR"][:]) * -1)
             pattern[-3] = depth_index
         data = np.array(nc.variables[variable][pattern])
         data[data == -999] = np.nan
-        timestamps = [datetime.utcfromtimestamp(t + (datetime(2008, 3, 1).replace(tzinfo=timezone.utc) - datetime(1970, 1, 1).replace(tzinfo=timezone.utc)).total_seconds()).replace(tzinfo=timezone.utc) for t in times]
         depth = np.array(nc.variables["ZK_LYR"][pattern[-3]])
         x_coor = np.array(nc.variables["XZ"][pattern[-2]][pattern[-1]])
         y_coor = np.array(nc.variables["YZ"][pattern[-2]][pattern[-1]])
@@ -51,19 +47,16 @@ def extract_data_from_output_file(file_path, variable, pattern, depth=1):
 
 # %%
 def extract_timeseries_from_output_file_by_coordinates(file_path, variable, pattern, x_coor, y_coor, depth):
+    pattern = list(pattern)
     with netCDF4.Dataset(file_path) as nc:
-        coor_index = get_closest_index_by_coord(np.array(nc.variables["XZ"][:]), np.array(nc.variables["YZ"][:]),
-                                                x_coor, y_coor)
+        coor_index = get_flow_spatial_index(file_path).query_one(x_coor, y_coor)
         pattern[-2] = coor_index[0]
         pattern[-1] = coor_index[1]
         depth_index = get_closest_index(depth, np.array(nc.variables["ZK_LYR"][:]) * -1)
         pattern[-3] = depth_index
-        times = np.array(nc.variables["time"][:])
+        timestamps = decode_flow_times(nc)
         data = np.array(nc.variables[variable][pattern])
         data[data == -999] = np.nan
-        timestamps = [datetime.utcfromtimestamp(t + (
-                    datetime(2008, 3, 1).replace(tzinfo=timezone.utc) - datetime(1970, 1, 1).replace(
-                tzinfo=timezone.utc)).total_seconds()).replace(tzinfo=timezone.utc) for t in times]
         depth_plot = np.array(nc.variables["ZK_LYR"][pattern[-3]])
         x_coor_plot = np.array(nc.variables["XZ"][pattern[-2]][pattern[-1]])
         y_coor_plot = np.array(nc.variables["YZ"][pattern[-2]][pattern[-1]])
@@ -71,9 +64,7 @@ def extract_timeseries_from_output_file_by_coordinates(file_path, variable, patt
 
 # %%
 def find_closest_date_index(date_array, target_date):
-    time_diff = np.abs(np.array(date_array) - target_date)
-    closest_index = np.argmin(time_diff)
-    return closest_index
+    return find_closest_time_index(to_datetime64_array(date_array), target_date)
 
 # %%
 def plot_heatmap(parameters, date_to_plot):
@@ -83,7 +74,7 @@ def plot_heatmap(parameters, date_to_plot):
     fig.suptitle(parameters[0]["timestamps"][time_index])
     for j in range(len(parameters)):
         plt.subplot(1, len(parameters), j + 1)
-        plt.imshow(parameters[j]["data"][time_index], cmap='jet', interpolation='nearest')
+        plt.imshow(get_frame(parameters[j]["data"], time_index), cmap='jet', interpolation='nearest')
         plt.title(parameters[j]["name"])
         plt.colorbar()
     plt.tight_layout()
@@ -97,7 +88,7 @@ def plot_transect(parameters, date_to_plot):
     fig.suptitle(parameters[0]["timestamps"][time_index])
     for j in range(len(parameters)):
         plt.subplot(len(parameters), 1, j + 1)
-        plt.imshow(parameters[j]["data"][time_index], cmap='jet', interpolation='nearest', origin='lower')
+        plt.imshow(get_frame(parameters[j]["data"], time_index), cmap='jet', interpolation='nearest', origin='lower')
         plt.title(parameters[j]["name"])
         plt.colorbar()
     plt.tight_layout()
@@ -116,19 +107,8 @@ def plot_timeseries(parameters):
     plt.show()
 
 # %%
-def plot_xy_heatmap(parameters, date_to_plot):
+def plot_xy_heatmap(parameters, date_to_plot, resolution=None):
+    # Cells are rasterised through a mapping cached per grid, see raster.XYHeatmapFigure
     time_index = find_closest_date_index(parameters[0]["timestamps"], date_to_plot)
-    fig = plt.figure(figsize=(10, 20))
-    fig.suptitle(f"Timestamp: {parameters[0]['timestamps'][time_index]}")
-    for i, param in enumerate(parameters, start=1):
-        x_coords = param['x_coords'].flatten()
-        y_coords = param['y_coords'].flatten()
-        data_values = param['data'][time_index].flatten()
-        df = pd.DataFrame({'X': x_coords, 'Y': y_coords, 'Value': data_values})
-        df = df[df['X'] != 0]
-        ax = plt.subplot(len(parameters), 1, i)
-        scatter = ax.scatter(df['X'], df['Y'], c=df['Value'], cmap='jet', marker='s')
-        plt.colorbar(scatter, ax=ax, label='Value')
-        plt.title(param['name'])
-    plt.tight_layout()
-    plt.show()
+    XYHeatmapFigure(parameters, resolution).draw(time_index)
+    plt.show()
\ No newline at end of file
@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from utils import (build_spatial_index,
+                   build_raster_regridder,
+                   typical_cell_size,
+                   to_utc_datetime64)
+from .frames import get_frame
+from .times import to_datetime64_array
+
+_grid_rasters = {}
+
+
+class GridRaster:
+    def __init__(self, x_coords, y_coords, resolution: float = None, max_distance: float = None):
+        # Nearest-cell regridder from the valid (X != 0) cells of a curvilinear grid to a regular raster covering
+        # them, computed once per grid: each frame is then rasterised with a single sparse product. Pixels further
+        # than max_distance (the local size of their closest cell by default) from any cell are masked.
+        spatial_index = build_spatial_index(x_coords, y_coords, mask_zero=True)
+        resolution = typical_cell_size(spatial_index) / 2 if resolution is None else resolution
+
+        x_min, y_min = spatial_index.points.min(axis=0) - resolution / 2
+        x_max, y_max = spatial_index.points.max(axis=0) + resolution / 2
+        self.regridder = build_raster_regridder(x_coords, y_coords, (x_min, x_max, y_min, y_max), resolution,
+                                                neighbours=1, max_distance=max_distance, mask_zero=True,
+                                                spatial_index=spatial_index)
+        self.raster_shape = self.regridder.raster_shape
+        self.extent = (self.regridder.x_pixels[0] - resolution / 2, self.regridder.x_pixels[-1] + resolution / 2,
+                       self.regridder.y_pixels[0] - resolution / 2, self.regridder.y_pixels[-1] + resolution / 2)
+
+    def to_raster(self, frame) -> np.ma.MaskedArray:
+        values = self.regridder.apply(frame)
+
+        return np.ma.masked_invalid(values)
+
+
+def get_grid_raster(x_coords, y_coords, resolution: float = None, max_distance: float = None) -> GridRaster:
+    # Rasters are cached by grid content, so every frame and every parameter on the same grid share one mapping
+    x_coords = np.ascontiguousarray(x_coords, dtype=float)
+    y_coords = np.ascontiguousarray(y_coords, dtype=float)
+    key = (hashlib.sha1(x_coords.tobytes() + y_coords.tobytes()).hexdigest(), x_coords.shape, resolution,
+           max_distance)
+    if key not in _grid_rasters:
+        _grid_rasters[key] = GridRaster(x_coords, y_coords, resolution, max_distance)
+
+    return _grid_rasters[key]
+
+
+class XYHeatmapFigure:
+    def __init__(self, parameters, resolution: float = None, clims: list = None):
+        # One figure with an image per parameter; frames only update the image data
+        self.parameters = parameters
+        self.timestamps = parameters[0]['timestamps']
+        self.rasters = [get_grid_raster(param['x_coords'], param['y_coords'], resolution) for param in parameters]
+        self.clims = clims if clims is not None else [None] * len(parameters)
+        self.figure = plt.figure(figsize=(10, 20))
+        self.title = self.figure.suptitle('')
+        self.images = []
+        for i, (param, raster) in enumerate(zip(parameters, self.rasters), start=1):
+            ax = plt.subplot(len(parameters), 1, i)
+            image = ax.imshow(np.ma.masked_all(raster.raster_shape), cmap='jet', origin='lower',
+                              extent=raster.extent, interpolation='nearest', aspect='equal')
+            plt.colorbar(image, ax=ax, label='Value')
+            plt.title(param['name'])
+            self.images.append(image)
+        plt.tight_layout()
+
+    def draw(self, time_index: int) -> None:
+        self.title.set_text(f"Timestamp: {self.timestamps[time_index]}")
+        for param, raster, image, clim in zip(self.parameters, self.rasters, self.images, self.clims):
+            values = raster.to_raster(get_frame(param['data'], time_index))
+            image.set_data(values)
+            if clim is not None:
+                image.set_clim(*clim)
+            elif values.count():
+                image.set_clim(values.min(), values.max())
+
+    def export_frames(self, output_folder: str, time_indices, dpi: int = 100, file_prefix: str = 'frame') -> list[str]:
+        os.makedirs(output_folder, exist_ok=True)
+        file_paths = []
+        for time_index in time_indices:
+            self.draw(time_index)
+            file_path = os.path.join(output_folder, f'{file_prefix}_{time_index:06d}.png')
+            self.figure.savefig(file_path, dpi=dpi)
+            file_paths.append(file_path)
+
+        return file_paths
+
+    def close(self) -> None:
+        plt.close(self.figure)
+
+
+def export_xy_heatmap_frames(parameters, output_folder: str, start_date=None, end_date=None, step: int = 1,
+                             dpi: int = 100, resolution: float = None, clims: list = None) -> list[str]:
+    # PNG per time step between start_date and end_date, all drawn on the same figure and artists
+    timestamps = to_datetime64_array(parameters[0]['timestamps'])
+    first_index = 0 if start_date is None else int(np.searchsorted(timestamps, to_utc_datetime64(start_date)))
+    last_index = len(timestamps) if end_date is None else int(np.searchsorted(timestamps, to_utc_datetime64(end_date),
+                                                                              side='right'))
+    heatmap_figure = XYHeatmapFigure(parameters, resolution, clims)
+    try:
+        return heatmap_figure.export_frames(output_folder, range(first_index, last_index, step), dpi)
+    finally:
+        heatmap_figure.close()
@@ -0,0 +1,56 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils import to_utc_datetime64
+
+FLOW_REFERENCE_DATE = np.datetime64('2008-03-01', 'ns')
+TIME_UNITS_NS = {'seconds': 10 ** 9, 'minutes': 60 * 10 ** 9, 'hours': 3600 * 10 ** 9, 'days': 86400 * 10 ** 9}
+TIME_UNITS_PATTERN = re.compile(r'^\s*(\w+)\s+since\s+(.+?)\s*$')
+
+
+def get_reference_date(nc) -> tuple[np.datetime64, int]:
+    # Reference date and step (in ns) of the time variable, from its 'units' attribute
+    # ("seconds since 2008-03-01 00:00:00"), else from the ITDATE variable of the trim file.
+    time_variable = nc.variables['time']
+    match = TIME_UNITS_PATTERN.match(getattr(time_variable, 'units', ''))
+    if match is not None and match.group(1).lower() in TIME_UNITS_NS:
+        reference_date = pd.Timestamp(match.group(2))
+        if reference_date.tzinfo is not None:
+            reference_date = reference_date.tz_convert(None)
+        return reference_date.to_datetime64().astype('datetime64[ns]'), TIME_UNITS_NS[match.group(1).lower()]
+
+    if 'ITDATE' in nc.variables:
+        date, hour = (int(value) for value in np.asarray(nc.variables['ITDATE'][:]).ravel()[:2])
+        return np.datetime64(pd.Timestamp(f'{date:08d}{hour:06d}')).astype('datetime64[ns]'), TIME_UNITS_NS['seconds']
+
+    return FLOW_REFERENCE_DATE, TIME_UNITS_NS['seconds']
+
+
+def decode_flow_times(nc) -> np.ndarray:
+    # Time variable of an open NetCDF file as a datetime64[ns] array, decoded in one vectorized pass
+    reference_date, step_ns = get_reference_date(nc)
+    offsets = np.asarray(nc.variables['time'][:], dtype='float64')
+
+    return reference_date + np.rint(offsets * step_ns).astype('int64').astype('timedelta64[ns]')
+
+
+def to_datetime64_array(dates) -> np.ndarray:
+    # datetime64[ns] view of an array of dates, tz-aware datetimes are converted to naive UTC
+    if isinstance(dates, np.ndarray) and np.issubdtype(dates.dtype, np.datetime64):
+        return dates.astype('datetime64[ns]', copy=False)
+
+    return pd.to_datetime(dates, utc=True).tz_convert(None).to_numpy(dtype='datetime64[ns]')
+
+
+def find_closest_time_index(sorted_times: np.ndarray, target_date) -> int:
+    # Binary search in a sorted datetime64 array, ties go to the earlier time
+    target = to_utc_datetime64(target_date)
+    index = int(np.searchsorted(sorted_times, target))
+    if index == 0:
+        return 0
+    if index == len(sorted_times):
+        return len(sorted_times) - 1
+
+    return index if sorted_times[index] - target < target - sorted_times[index - 1] else index - 1
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+
+import netCDF4
+import numpy as np
+import xarray as xr
+from scipy import sparse
+
+from utils import (build_spatial_index,
+                   interpolation_weights,
+                   typical_cell_size,
+                   SparseInterpolator)
+from .extract_points import FLOW_FILL_VALUE
+from .times import decode_flow_times
+
+TRANSECT_SUFFIX = '.transect.npz'
+
+_transects = {}
+
+
+class Transect(SparseInterpolator):
+    def __init__(self, distances: np.ndarray, points: np.ndarray, weights: sparse.csr_matrix, cells: np.ndarray,
+                 grid_shape: tuple):
+        # weights: (sample, used cell) interpolation weights of the samples along the line
+        super().__init__(weights, cells, grid_shape)
+        self.distances = distances
+        self.points = points
+
+    def __len__(self) -> int:
+        return len(self.distances)
+
+    def apply(self, values, cell_axis: int = None, in_box: bool = False) -> np.ndarray:
+        # Cell dimensions of values replaced by the samples along the line, see SparseInterpolator.interpolate
+        return self.interpolate(values, cell_axis, in_box)
+
+    def _arrays(self) -> dict:
+        return {**super()._arrays(), 'distances': self.distances, 'points': self.points}
+
+    @classmethod
+    def load(cls, file_path: str):
+        with np.load(file_path) as saved:
+            return cls(saved['distances'], saved['points'], cls._weights_from_arrays(saved), saved['cells'],
+                       saved['grid_shape'])
+
+
+def sample_line(line_array, resolution: float) -> tuple[np.ndarray, np.ndarray]:
+    # Regularly spaced (distance along the line, (x, y)) samples of a polyline [[x0, y0], [x1, y1], ...]
+    vertices = np.asarray(line_array, dtype=float)
+    vertex_distances = np.concatenate(([0.], np.cumsum(np.hypot(*np.diff(vertices, axis=0).T))))
+    distances = np.arange(0., vertex_distances[-1] + resolution / 2, resolution)
+    points = np.column_stack((np.interp(distances, vertex_distances, vertices[:, 0]),
+                              np.interp(distances, vertex_distances, vertices[:, 1])))
+
+    return distances, points
+
+
+def build_transect(x_array, y_array, line_array, resolution: float = None, neighbours: int = 4,
+                   max_distance: float = None, mask_zero: bool = True) -> Transect:
+    # Inverse-distance weights of the neighbours closest cells of each sample of the line, samples further
+    # than max_distance (the local size of their closest cell by default) from any valid cell are outside the
+    # domain (all NaN).
+    spatial_index = build_spatial_index(x_array, y_array, mask_zero)
+    resolution = typical_cell_size(spatial_index) / 2 if resolution is None else resolution
+
+    distances, points = sample_line(line_array, resolution)
+    weights, cells = interpolation_weights(spatial_index, points, neighbours, max_distance)
+
+    return Transect(distances, points, weights, cells, spatial_index.grid_shape)
+
+
+def get_transect(x_array, y_array, line_array, resolution: float = None, neighbours: int = 4,
+                 max_distance: float = None, mask_zero: bool = True, cache_folder: str = None) -> Transect:
+    # Transect cached per (grid, line, parameters) in memory, and on disk in cache_folder if given
+    x_array = np.ascontiguousarray(np.ma.filled(np.ma.asarray(x_array, dtype=float), np.nan))
+    y_array = np.ascontiguousarray(np.ma.filled(np.ma.asarray(y_array, dtype=float), np.nan))
+    max_distance = None if max_distance is None else float(max_distance)
+    parameters = json.dumps([np.asarray(line_array, dtype=float).tolist(), resolution, neighbours, max_distance,
+                             mask_zero])
+    key = hashlib.sha256(x_array.tobytes() + y_array.tobytes() + str(x_array.shape).encode('utf-8')
+                         + parameters.encode('utf-8')).hexdigest()[:32]
+    if key in _transects:
+        return _transects[key]
+
+    cache_path = os.path.join(cache_folder, key + TRANSECT_SUFFIX) if cache_folder is not None else None
+    if cache_path is not None and os.path.exists(cache_path):
+        transect = Transect.load(cache_path)
+    else:
+        transect = build_transect(x_array, y_array, line_array, resolution, neighbours, max_distance, mask_zero)
+        if cache_path is not None:
+            os.makedirs(cache_folder, exist_ok=True)
+            transect.save(cache_path)
+    _transects[key] = transect
+
+    return transect
+
+
+def extract_transect_from_file(file_path: str, variable: str, line_array, x_name: str = 'XZ', y_name: str = 'YZ',
+                               leading_index: tuple = (), mask_zero: bool = True, resolution: float = None,
+                               time_chunk: int = 100, max_distance: float = None,
+                               cache_folder: str = None) -> xr.DataArray:
+    # (time, layer, distance) section of a time-first variable along line_array. Only the box of cells around
+    # the line is read, time_chunk steps at a time; leading_index selects the dimensions between time and the
+    # remaining ones (e.g. (0,) for the first constituent of R1).
+    with netCDF4.Dataset(file_path) as nc:
+        transect = get_transect(nc.variables[x_name][:], nc.variables[y_name][:], line_array, resolution,
+                                max_distance=max_distance, mask_zero=mask_zero, cache_folder=cache_folder)
+        nc_variable = nc.variables[variable]
+        cell_dims = nc.variables[x_name].dimensions
+        # Staggered variables (U1, V1) use other dimension names than the cell centres: cells are then the last dims
+        cell_axis = (nc_variable.dimensions.index(cell_dims[0]) if cell_dims[0] in nc_variable.dimensions
+                     else len(nc_variable.dimensions) - len(cell_dims))
+        index = [slice(None)] * len(nc_variable.dimensions)
+        index[1:1 + len(leading_index)] = leading_index
+        # Position of the cell dimensions once time and the leading dimensions have been selected
+        result_cell_axis = cell_axis - len(leading_index)
+        other_dims = [dimension for axis, dimension in enumerate(nc_variable.dimensions)
+                      if 1 + len(leading_index) <= axis and not cell_axis <= axis < cell_axis + len(cell_dims)]
+
+        sections = []
+        for first_step in range(0, nc_variable.shape[0], time_chunk):
+            index[0] = slice(first_step, first_step + time_chunk)
+            values = np.ma.filled(np.ma.asarray(transect.read_box(nc_variable, index, cell_axis), dtype='float64'),
+                                  np.nan)
+            values[values == FLOW_FILL_VALUE] = np.nan
+            sections.append(transect.apply(values, cell_axis=result_cell_axis, in_box=True))
+        times = decode_flow_times(nc)
+
+    dims = ['time'] + (['layer'] if len(other_dims) == 1 else other_dims) + ['distance']
+    return xr.DataArray(
+        np.concatenate(sections),
+        dims=dims,
+        coords={
+            'time': times,
+            'distance': transect.distances,
+            'x': ('distance', transect.points[:, 0]),
+            'y': ('distance', transect.points[:, 1])
+        },
+        name=variable
+    )
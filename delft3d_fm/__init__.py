@@ -0,0 +1,7 @@
+from .extract_points import (extract_stations_from_partitioned_map,
+                             get_partitioned_face_index,
+                             get_partition_map_files)
+from .transect import extract_transect_from_map
+from .regrid import (bbox_from_config,
+                     get_map_regridder,
+                     rasterize_map_variable)
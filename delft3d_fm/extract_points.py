@@ -0,0 +1,147 @@
+import hashlib
+import os
+
+import netCDF4
+import numpy as np
+import xarray as xr
+
+from utils import (INDEX_CACHE_DIR,
+                   SpatialIndex)
+from delft3d_flow.times import decode_flow_times
+
+FACE_X = 'mesh2d_face_x'
+FACE_Y = 'mesh2d_face_y'
+FACE_DOMAIN = 'mesh2d_flowelem_domain'
+FACE_DIMENSION = 'mesh2d_nFaces'
+LAYER_COORDINATES = ('mesh2d_layer_z', 'mesh2d_layer_sigma')
+PARTITIONED_INDEX_SUFFIX = '.faces.npz'
+
+_partitioned_indexes = {}
+
+
+def get_partition_map_files(config_plots: dict) -> list[str]:
+    # Map files of a model of config_plots.json: one per partition, or the single merged/sequential map file
+    if 'partition_number' in config_plots:
+        return [os.path.join(config_plots['working_dir'], f'FlowFM_{n:04}_map.nc')
+                for n in range(config_plots['partition_number'])]
+
+    return [config_plots['file_nc_map']]
+
+
+class PartitionedFaceIndex:
+    def __init__(self, points: np.ndarray, partitions: np.ndarray, faces: np.ndarray):
+        # Faces owned by each partition (ghost faces excluded), with their partition number and local face index
+        self.partitions = partitions
+        self.faces = faces
+        self.spatial_index = SpatialIndex(points, np.arange(len(points)), (len(points),))
+
+    def query(self, x_coords, y_coords) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # (partition, local face, distance) of the face closest to each point
+        (rows,), distances = self.spatial_index.query(x_coords, y_coords)
+
+        return self.partitions[rows], self.faces[rows], distances
+
+
+def _read_owned_faces(map_file: str, partition: int) -> tuple[np.ndarray, np.ndarray]:
+    with netCDF4.Dataset(map_file) as nc:
+        points = np.column_stack((np.asarray(nc.variables[FACE_X][:], dtype=float),
+                                  np.asarray(nc.variables[FACE_Y][:], dtype=float)))
+        if FACE_DOMAIN in nc.variables:
+            owned = np.asarray(nc.variables[FACE_DOMAIN][:]) == partition
+        else:
+            owned = np.ones(len(points), dtype=bool)
+    faces = np.flatnonzero(owned)
+
+    return points[faces], faces
+
+
+def get_partitioned_face_index(map_files: list[str], cache_folder: str = None) -> PartitionedFaceIndex:
+    # Face index of all the partitions of a run, built once from the face coordinates only and cached in
+    # memory and on disk (in INDEX_CACHE_DIR by default). Rebuilt when any map file changes.
+    map_files = [os.path.abspath(map_file) for map_file in map_files]
+    source_stamp = [value for map_file in map_files
+                    for value in (os.path.getsize(map_file), os.path.getmtime(map_file))]
+    memory_key = tuple(map_files)
+    cached = _partitioned_indexes.get(memory_key)
+    if cached is not None and cached[1] == source_stamp:
+        return cached[0]
+
+    cache_folder = cache_folder if cache_folder is not None else INDEX_CACHE_DIR
+    key = hashlib.sha256('|'.join(map_files).encode('utf-8')).hexdigest()[:16]
+    cache_path = os.path.join(cache_folder, f'{os.path.basename(map_files[0])}_{key}{PARTITIONED_INDEX_SUFFIX}')
+    face_index = None
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as saved:
+            if saved['source_stamp'].tolist() == source_stamp:
+                face_index = PartitionedFaceIndex(saved['points'], saved['partitions'], saved['faces'])
+    if face_index is None:
+        owned_faces = [_read_owned_faces(map_file, partition) for partition, map_file in enumerate(map_files)]
+        points = np.concatenate([points for points, _ in owned_faces])
+        partitions = np.concatenate([np.full(len(faces), partition)
+                                     for partition, (_, faces) in enumerate(owned_faces)])
+        faces = np.concatenate([faces for _, faces in owned_faces])
+        face_index = PartitionedFaceIndex(points, partitions, faces)
+        try:
+            os.makedirs(cache_folder, exist_ok=True)
+            temp_path = cache_path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                np.savez(f, points=points, partitions=partitions, faces=faces,
+                         source_stamp=np.array(source_stamp, dtype=float))
+            os.replace(temp_path, cache_path)
+        except OSError:
+            pass
+
+    _partitioned_indexes[memory_key] = (face_index, source_stamp)
+
+    return face_index
+
+
+def _read_face_column(nc_variable, face: int) -> np.ndarray:
+    # (time, layer) values of a single face, or (time,) for 2D variables, whatever the position of the face dimension
+    index = tuple(face if dimension == FACE_DIMENSION else slice(None) for dimension in nc_variable.dimensions)
+
+    return np.ma.filled(np.ma.asarray(nc_variable[index], dtype='float64'), np.nan)
+
+
+def extract_stations_from_partitioned_map(map_files: list[str], stations: dict[str, tuple[float, float]],
+                                          variables: list[str] = ('mesh2d_tem1',),
+                                          cache_folder: str = None) -> xr.Dataset:
+    # stations: {name: (x, y)} in the model crs. Each station is read from the partition that owns its closest
+    # face, only the (time, layer) column of that face is read from disk.
+    station_names = list(stations)
+    station_coords = np.array([stations[name] for name in station_names], dtype=float)
+    partitions, faces, _ = get_partitioned_face_index(map_files, cache_folder).query(station_coords[:, 0],
+                                                                                      station_coords[:, 1])
+
+    data_vars = {variable: [None] * len(station_names) for variable in variables}
+    face_x = np.empty(len(station_names))
+    face_y = np.empty(len(station_names))
+    times = layers = None
+    for partition in np.unique(partitions):
+        with netCDF4.Dataset(map_files[partition]) as nc:
+            if times is None:
+                times = decode_flow_times(nc)
+                layer_name = next((name for name in LAYER_COORDINATES if name in nc.variables), None)
+                layers = np.asarray(nc.variables[layer_name][:], dtype=float) if layer_name is not None else None
+            for row in np.flatnonzero(partitions == partition):
+                face_x[row] = nc.variables[FACE_X][faces[row]]
+                face_y[row] = nc.variables[FACE_Y][faces[row]]
+                for variable in variables:
+                    data_vars[variable][row] = _read_face_column(nc.variables[variable], faces[row])
+
+    coords = {
+        'station': station_names,
+        'time': times,
+        'partition': ('station', partitions),
+        'face': ('station', faces),
+        'x': ('station', face_x),
+        'y': ('station', face_y)
+    }
+    if layers is not None:
+        coords['layer'] = layers
+
+    return xr.Dataset(
+        {variable: (['station', 'time', 'layer'][:columns[0].ndim + 1], np.stack(columns))
+         for variable, columns in data_vars.items()},
+        coords=coords
+    )
@@ -0,0 +1,74 @@
+import netCDF4
+import numpy as np
+import xarray as xr
+
+from utils import (INDEX_CACHE_DIR,
+                   RasterRegridder,
+                   get_raster_regridder)
+from delft3d_flow.times import decode_flow_times
+from .extract_points import (FACE_X,
+                             FACE_Y,
+                             FACE_DIMENSION)
+
+
+def bbox_from_config(config_plots: dict) -> tuple:
+    # (x_min, x_max, y_min, y_max) from the sel_slice_x / sel_slice_y ranges of config_plots.json
+    return (*config_plots['sel_slice_x'], *config_plots['sel_slice_y'])
+
+
+def get_map_regridder(map_file: str, bbox: tuple, resolution: float, neighbours: int = 1,
+                      max_distance: float = None, cache_folder: str = None) -> RasterRegridder:
+    # Face-to-pixel weights of the mesh of a map file, cached in INDEX_CACHE_DIR by default
+    cache_folder = cache_folder if cache_folder is not None else INDEX_CACHE_DIR
+    with netCDF4.Dataset(map_file) as nc:
+        return get_raster_regridder(nc.variables[FACE_X][:], nc.variables[FACE_Y][:], bbox, resolution, neighbours,
+                                    max_distance, cache_folder=cache_folder)
+
+
+def rasterize_map_variable(map_file: str, variable: str, bbox: tuple, resolution: float, layer: int = None,
+                           time_slice: slice = slice(None), time_chunk: int = 24, output_path: str = None,
+                           neighbours: int = 1, max_distance: float = None, cache_folder: str = None,
+                           dtype: str = None) -> xr.DataArray:
+    # (time, [layer,] y, x) raster cube of a map variable. Time steps are read and regridded time_chunk at a time,
+    # only the faces under the raster are read. With output_path, chunks are appended to a Zarr store as they
+    # are computed and the cube is returned lazily from it. Pixels keep the precision of the variable (at least
+    # float32 to hold NaN) unless another dtype is given.
+    regridder = get_map_regridder(map_file, bbox, resolution, neighbours, max_distance, cache_folder)
+    with netCDF4.Dataset(map_file) as nc:
+        nc_variable = nc.variables[variable]
+        dtype = np.result_type(nc_variable.dtype, np.float32) if dtype is None else np.dtype(dtype)
+        face_axis = nc_variable.dimensions.index(FACE_DIMENSION)
+        other_dims = [dimension for axis, dimension in enumerate(nc_variable.dimensions)
+                      if axis not in (0, face_axis)]
+        index = [slice(None)] * len(nc_variable.dimensions)
+        if layer is not None:
+            index[nc_variable.dimensions.index(other_dims[0])] = layer
+            other_dims = []
+        result_face_axis = face_axis - sum(1 for axis in range(1, face_axis) if isinstance(index[axis], int))
+        dims = ['time'] + (['layer'] if len(other_dims) == 1 else other_dims) + ['y', 'x']
+
+        times = decode_flow_times(nc)
+        steps = range(*time_slice.indices(len(times)))
+        rasters = []
+        for chunk_start in range(0, len(steps), time_chunk):
+            chunk_steps = steps[chunk_start:chunk_start + time_chunk]
+            index[0] = slice(chunk_steps.start, chunk_steps.stop, chunk_steps.step)
+            values = np.ma.filled(np.ma.asarray(regridder.read_box(nc_variable, index, face_axis), dtype='float64'),
+                                  np.nan)
+            raster = xr.DataArray(
+                regridder.apply(values, cell_axis=result_face_axis, in_box=True).astype(dtype),
+                dims=dims,
+                coords={'time': times[index[0]], 'y': regridder.y_pixels, 'x': regridder.x_pixels},
+                name=variable
+            )
+            if output_path is None:
+                rasters.append(raster)
+            elif chunk_start == 0:
+                raster.to_dataset().chunk({'time': time_chunk}).to_zarr(output_path, mode='w')
+            else:
+                raster.to_dataset().chunk({'time': time_chunk}).to_zarr(output_path, append_dim='time')
+
+    if output_path is not None:
+        return xr.open_zarr(output_path)[variable]
+
+    return xr.concat(rasters, dim='time')
@@ -0,0 +1,14 @@
+import xarray as xr
+
+from delft3d_flow.transect import extract_transect_from_file
+from .extract_points import (FACE_X,
+                             FACE_Y)
+
+
+def extract_transect_from_map(map_file: str, variable: str, line_array, resolution: float = None,
+                              time_chunk: int = 100, max_distance: float = None,
+                              cache_folder: str = None) -> xr.DataArray:
+    # (time, layer, distance) section along a line_array of config_plots.json, from a sequential or merged map file
+    return extract_transect_from_file(map_file, variable, line_array, FACE_X, FACE_Y, mask_zero=False,
+                                      resolution=resolution, time_chunk=time_chunk, max_distance=max_distance,
+                                      cache_folder=cache_folder)
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import re
+
+import dask.array as da
+from dask.base import tokenize
+import numpy as np
+import pandas as pd
+import xarray as xr
+import xmitgcm as xm
+from xmitgcm.utils import parse_meta_file
+
+from utils import INDEX_CACHE_DIR
+
+INDEX_FILE_NAME = '{prefix}_{key}_index.json'
+
+_grids = {}
+
+
+class MDSRecordArray:
+    def __init__(self, file_paths: list[str], offset: int, record_shape: tuple, dtype: str):
+        # Lazy (iteration, *record_shape) view of one field of a multi-field MDS output: each iteration is read
+        # from its own .data file at a fixed byte offset, only when indexed.
+        self.file_paths = file_paths
+        self.offset = offset
+        self.record_shape = tuple(record_shape)
+        self.dtype = np.dtype(dtype)
+        self.shape = (len(file_paths),) + self.record_shape
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        iterations = range(len(self.file_paths))[key[0]]
+        record_key = key[1:]
+        if isinstance(iterations, int):
+            return self._read_record(iterations)[record_key]
+        records = [self._read_record(iteration)[record_key] for iteration in iterations]
+        if not records:
+            return np.empty((0,) + np.empty(self.record_shape)[record_key].shape, dtype=self.dtype)
+
+        return np.stack(records)
+
+    def _read_record(self, iteration: int) -> np.ndarray:
+        return np.memmap(self.file_paths[iteration], dtype=self.dtype, mode='r', offset=self.offset,
+                         shape=self.record_shape)
+
+
+def get_index_path(datapath: str, prefix: str, cache_folder: str = None) -> str:
+    # In cache_folder (INDEX_CACHE_DIR by default) under a name unique to the run folder
+    key = hashlib.sha256(os.path.abspath(datapath).encode('utf-8')).hexdigest()[:16]
+    cache_folder = cache_folder if cache_folder is not None else INDEX_CACHE_DIR
+
+    return os.path.join(cache_folder, INDEX_FILE_NAME.format(prefix=prefix, key=key))
+
+
+def list_iterations(datapath: str, prefix: str) -> list[int]:
+    # Iteration numbers of the prefix files of the run, from the file names only
+    pattern = re.compile(rf'^{re.escape(prefix)}\.(\d+)\.(data|meta)$')
+    extensions = {}
+    for entry in os.scandir(datapath):
+        match = pattern.match(entry.name)
+        if match is not None:
+            extensions.setdefault(int(match.group(1)), set()).add(match.group(2))
+
+    return sorted(iteration for iteration, found in extensions.items() if found == {'data', 'meta'})
+
+
+def get_meta_path(datapath: str, prefix: str, iteration: int) -> str:
+    return os.path.join(datapath, f'{prefix}.{iteration:010d}.meta')
+
+
+def _record_layout(meta: dict) -> tuple[list[str], list[int], str]:
+    # Field names, record shape (z, y, x) and dtype of an MDS meta file
+    fields = [field.strip() for field in meta.get('fldList', [])]
+    record_shape = [int(size) for size, _, _ in np.reshape(meta['dimList'], (-1, 3))][::-1]
+
+    return fields, record_shape, str(np.dtype(meta['dataprec']))
+
+
+def open_mitgcm_grid(gridpath: str, endian: str) -> xr.Dataset:
+    # Grid-only dataset (no iteration), loaded once per grid and shared by every run using it
+    key = (os.path.abspath(gridpath), endian)
+    if key not in _grids:
+        _grids[key] = xm.open_mdsdataset(gridpath, grid_dir=gridpath, iters=None, endian=endian)
+
+    return _grids[key]
+
+
+def build_mds_index(mitgcm_ds: xr.Dataset, datapath: str, prefix: str, iterations: list[int], parameters: dict):
+    # Byte layout of the fields of a dataset opened with xmitgcm, None if it can't be described by fixed offsets
+    fields, record_shape, dataprec = _record_layout(parse_meta_file(get_meta_path(datapath, prefix, iterations[0])))
+    itemsize = np.dtype(dataprec).itemsize
+    described_fields = []
+    for position, field in enumerate(fields):
+        if field not in mitgcm_ds.data_vars or mitgcm_ds[field].shape[1:] != tuple(record_shape):
+            return None
+        described_fields.append({
+            'name': field,
+            'dims': list(mitgcm_ds[field].dims),
+            'attrs': mitgcm_ds[field].attrs,
+            'offset': position * int(np.prod(record_shape)) * itemsize
+        })
+
+    return {
+        'parameters': parameters,
+        'fields': described_fields,
+        'field_names': fields,
+        'record_shape': record_shape,
+        'dataprec': dataprec,
+        'iterations': iterations,
+        'coord_attrs': {name: mitgcm_ds[name].attrs for name in ('time', 'iter') if name in mitgcm_ds.coords},
+        'attrs': mitgcm_ds.attrs
+    }
+
+
+def update_mds_index(mds_index: dict, datapath: str, prefix: str, iterations: list[int]) -> bool:
+    # Only the meta files of the iterations written since the index was saved are parsed.
+    # Returns False if one of them has another layout, in which case the index is stale.
+    indexed = set(mds_index['iterations'])
+    for iteration in iterations:
+        if iteration in indexed:
+            continue
+        fields, record_shape, dataprec = _record_layout(parse_meta_file(get_meta_path(datapath, prefix, iteration)))
+        if (fields, record_shape, dataprec) != (mds_index['field_names'], mds_index['record_shape'],
+                                               mds_index['dataprec']):
+            return False
+    mds_index['iterations'] = iterations
+
+    return True
+
+
+def open_from_mds_index(mds_index: dict, datapath: str, gridpath: str, prefix: str, ref_date, delta_t,
+                        endian: str) -> xr.Dataset:
+    # Same dataset as xmitgcm.open_mdsdataset, built from the index without touching the meta files
+    iterations = np.array(mds_index['iterations'], dtype='int64')
+    file_paths = [os.path.join(datapath, f'{prefix}.{iteration:010d}.data') for iteration in iterations]
+    dtype = np.dtype(mds_index['dataprec']).newbyteorder(endian)
+    record_shape = tuple(mds_index['record_shape'])
+
+    data_vars = {}
+    for field in mds_index['fields']:
+        records = MDSRecordArray(file_paths, field['offset'], record_shape, dtype)
+        # The token changes with the iteration files, so opens before and after new iterations don't share keys
+        name = f'{prefix}-{field["name"]}-{tokenize(file_paths, field["offset"], record_shape, dtype.str)}'
+        data = da.from_array(records, chunks=(1,) + record_shape, name=name,
+                             meta=np.empty((0,) * len(records.shape), dtype=dtype))
+        data_vars[field['name']] = xr.Variable(field['dims'], data, field['attrs'])
+
+    times = pd.Timestamp(ref_date).to_datetime64() + (iterations * delta_t * 10 ** 9).astype('timedelta64[ns]')
+    coord_attrs = mds_index['coord_attrs']
+    mitgcm_ds = open_mitgcm_grid(gridpath, endian).assign_coords(
+        time=xr.Variable('time', times.astype('datetime64[ns]'), coord_attrs.get('time')),
+        iter=xr.Variable('time', iterations, coord_attrs.get('iter'))
+    )
+    mitgcm_ds = mitgcm_ds.assign(data_vars)
+    mitgcm_ds.attrs = mds_index['attrs']
+
+    return mitgcm_ds
+
+
+def load_mds_index(index_path: str, parameters: dict):
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r') as file:
+        mds_index = json.load(file)
+
+    return mds_index if mds_index['parameters'] == parameters else None
+
+
+def save_mds_index(mds_index: dict, index_path: str) -> None:
+    try:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        temp_path = index_path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(mds_index, file, default=str)
+        os.replace(temp_path, index_path)
+    except OSError:
+        # Read-only cache folder: the run is opened with xmitgcm every time
+        pass
@@ -3,36 +3,61 @@ import json
 import os
 import socket
 
+from .mds_index import (build_mds_index,
+                        get_index_path,
+                        list_iterations,
+                        load_mds_index,
+                        open_from_mds_index,
+                        save_mds_index,
+                        update_mds_index)
+
+MITGCM_PREFIX = '3Dsnaps'
+
 
 def convert_ds_to_little_endian(mitgcm_ds):
-    mitgcm_ds = mitgcm_ds.astype('<f8')
-    mitgcm_ds= mitgcm_ds.assign(Z=mitgcm_ds['Z'].astype('<f8'))
-    mitgcm_ds= mitgcm_ds.assign(XC=mitgcm_ds['XC'].astype('<f8'))
-    mitgcm_ds= mitgcm_ds.assign(YC=mitgcm_ds['YC'].astype('<f8'))
-    mitgcm_ds= mitgcm_ds.assign(XG=mitgcm_ds['XG'].astype('<f8'))
-    mitgcm_ds= mitgcm_ds.assign(YG=mitgcm_ds['YG'].astype('<f8'))
-    mitgcm_ds= mitgcm_ds.assign(Zp1=mitgcm_ds['Zp1'].astype('<f8'))
-    mitgcm_ds= mitgcm_ds.assign(Zu=mitgcm_ds['Zu'].astype('<f8'))
-    mitgcm_ds= mitgcm_ds.assign(Zl=mitgcm_ds['Zl'].astype('<f8'))
-    
-    return mitgcm_ds
-
-
-def open_mitgcm_ds(datapath, gridpath, ref_date, dt_mitgcm_results, endian):
-    ds = xm.open_mdsdataset(
-                            datapath, 
-                            grid_dir=gridpath, 
-                            ref_date=ref_date, 
-                            prefix='3Dsnaps', 
-                            delta_t=dt_mitgcm_results, 
-                            endian=endian)
+    # Big-endian variables and coordinates get the little-endian version of their own dtype (float32 stays
+    # float32). On dask-backed variables astype is lazy: bytes are only swapped per chunk when it is read.
+    converted = {name: variable.astype(variable.dtype.newbyteorder('<'))
+                 for name, variable in mitgcm_ds.variables.items() if variable.dtype.byteorder == '>'}
+    data_vars = {name: variable for name, variable in converted.items() if name in mitgcm_ds.data_vars}
+    coords = {name: variable for name, variable in converted.items() if name not in mitgcm_ds.data_vars}
+
+    return mitgcm_ds.assign_coords(coords).assign(data_vars)
+
+
+def open_mitgcm_ds(datapath, gridpath, ref_date, dt_mitgcm_results, endian, use_index=True, cache_folder=None):
+    # The first open goes through xmitgcm and saves the byte layout of the iterations in cache_folder
+    # (INDEX_CACHE_DIR by default). Later opens build the same dataset from it, with the grid shared by the runs
+    # of gridpath, and only parse the meta files of the new iterations.
+    parameters = {'gridpath': os.path.abspath(gridpath), 'ref_date': str(ref_date),
+                  'delta_t': dt_mitgcm_results, 'endian': endian}
+    index_path = get_index_path(datapath, MITGCM_PREFIX, cache_folder)
+    iterations = list_iterations(datapath, MITGCM_PREFIX) if use_index else []
+    mds_index = load_mds_index(index_path, parameters) if iterations else None
+    indexed_iterations = mds_index['iterations'] if mds_index is not None else None
+    if mds_index is not None and update_mds_index(mds_index, datapath, MITGCM_PREFIX, iterations):
+        ds = open_from_mds_index(mds_index, datapath, gridpath, MITGCM_PREFIX, ref_date, dt_mitgcm_results, endian)
+        if iterations != indexed_iterations:
+            save_mds_index(mds_index, index_path)
+    else:
+        ds = xm.open_mdsdataset(
+                                datapath, 
+                                grid_dir=gridpath, 
+                                ref_date=ref_date, 
+                                prefix=MITGCM_PREFIX, 
+                                delta_t=dt_mitgcm_results, 
+                                endian=endian)
+        if iterations:
+            mds_index = build_mds_index(ds, datapath, MITGCM_PREFIX, iterations, parameters)
+            if mds_index is not None:
+                save_mds_index(mds_index, index_path)
     if endian == '>':
         ds = convert_ds_to_little_endian(ds)
 
     return ds
 
 
-def open_mitgcm_ds_from_config(config_path, model):
+def open_mitgcm_ds_from_config(config_path, model, use_index=True, cache_folder=None):
     with open(config_path, 'r') as file:
         mitgcm_config = json.load(file)[socket.gethostname()][model]
         
@@ -42,4 +67,5 @@ def open_mitgcm_ds_from_config(config_path, model):
     dt_mitgcm_results = mitgcm_config['dt']
     endian = mitgcm_config['endian']
 
-    return mitgcm_config, open_mitgcm_ds(datapath, gridpath, ref_date, dt_mitgcm_results, endian)
+    return mitgcm_config, open_mitgcm_ds(datapath, gridpath, ref_date, dt_mitgcm_results, endian, use_index,
+                                          cache_folder)
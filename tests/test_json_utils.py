@@ -0,0 +1,49 @@
+import json
+
+import numpy as np
+
+from utils import decode_json_with_arrays
+
+
+def test_nested_field_with_the_same_name_is_not_decoded():
+    json_data = decode_json_with_arrays(b'{"meta":{"x":[0]},"x":[1,2]}', {'x': 'float64'})
+
+    np.testing.assert_array_equal(json_data['x'], [1., 2.])
+    assert json_data['meta'] == {'x': [0]}
+
+
+def test_field_name_inside_a_string_is_ignored():
+    payload = json.dumps({'note': '}"x": [9]', 'x': [1, None]}).encode()
+    json_data = decode_json_with_arrays(payload, {'x': 'float64'})
+
+    np.testing.assert_array_equal(json_data['x'], [1., np.nan])
+    assert json_data['note'] == '}"x": [9]'
+
+
+def test_only_nested_field_is_left_as_is():
+    json_data = decode_json_with_arrays(b'{"meta":{"x":[0]}}', {'x': 'float64'})
+
+    assert json_data == {'meta': {'x': [0]}}
+
+
+def test_duplicate_top_level_field_falls_back_to_json():
+    json_data = decode_json_with_arrays(b'{"x":[1],"x":[3,4]}', {'x': 'float64'})
+
+    np.testing.assert_array_equal(json_data['x'], [3., 4.])
+
+
+def test_matches_json_loads_on_rows():
+    values = [[1.5, None, 3.], [4., 5., 6.]]
+    payload = json.dumps({'time': [0, 1], 'data': values, 'unit': 'degC'}).encode()
+    json_data = decode_json_with_arrays(payload, {'time': 'int64', 'data': 'float64'})
+
+    np.testing.assert_array_equal(json_data['data'], np.array(values, dtype=float))
+    np.testing.assert_array_equal(json_data['time'], [0, 1])
+    assert json_data['unit'] == 'degC'
+
+
+def test_floats_are_the_same_as_json():
+    values = np.random.default_rng(0).random(1000).tolist()
+    json_data = decode_json_with_arrays(json.dumps({'x': values}).encode(), {'x': 'float64'})
+
+    np.testing.assert_array_equal(json_data['x'], values)
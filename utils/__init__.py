@@ -1,11 +1,39 @@
-from .download_utils import try_download
+from .download_utils import (try_download,
+                             fetch_many,
+                             download_to_file,
+                             file_sha256)
+from .cache_utils import (INDEX_CACHE_DIR,
+                          enable_cache,
+                          disable_cache,
+                          cache_stats)
 from .json_utils import (download_json,
                          open_json,
-                         save_json)
+                         save_json,
+                         decode_json_with_arrays)
+from .spatial_index import (SpatialIndex,
+                            build_spatial_index,
+                            get_file_spatial_index,
+                            get_flow_spatial_index,
+                            get_fm_spatial_index)
+from .sorted_axis import SortedAxis
+from .time_utils import (to_utc_datetime64,
+                         sorted_unique_time_order)
+from .sparse_interpolation import (SparseInterpolator,
+                                   RasterRegridder,
+                                   interpolation_weights,
+                                   typical_cell_size,
+                                   local_cell_sizes,
+                                   build_raster_regridder,
+                                   get_raster_regridder)
 from .coordinates_conversion_utils import (translate_grid_to_origin,
                                            get_grid_angle,
                                            rotate_grid)
-from .data_transform import (interpolate_to_axis,
-                             resample_time,
-                             resample_depth)
+try:
+    from .data_transform import (interpolate_to_axis,
+                                 resample_time,
+                                 resample_depth)
+except ModuleNotFoundError as error:
+    # data_transform.py is not in the repository: the rest of utils stays importable without it
+    if error.name != f'{__name__}.data_transform':
+        raise
 from .compute_metrics import (compute_rmse)
\ No newline at end of file
@@ -0,0 +1,127 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'plot_results')
+# Default folder of the indexes and weights derived from model and measurement files, out of the data folders
+INDEX_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'indexes')
+
+
+class CacheMissError(FileNotFoundError):
+    pass
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = None, max_size_bytes: int = None,
+                 offline: bool = False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size_bytes = max_size_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size_bytes = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.cache_dir) if entry.is_file() and entry.name.endswith('.bin')]
+
+    def path_for(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.bin')
+
+    def get(self, url: str):
+        path = self.path_for(url)
+        try:
+            stat = os.stat(path)
+            expired = self.ttl is not None and time.time() - stat.st_mtime > self.ttl
+            if not expired or self.offline:
+                with open(path, 'rb') as f:
+                    content = f.read()
+                # atime tracks last use for LRU eviction, mtime keeps the time the entry was stored
+                os.utime(path, (time.time(), stat.st_mtime))
+                with self._lock:
+                    self.hits += 1
+                return content
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            self.misses += 1
+        if self.offline:
+            raise CacheMissError(f"Cache-only mode: {url} is not in cache {self.cache_dir}")
+
+        return None
+
+    def put(self, url: str, content: bytes) -> None:
+        path = self.path_for(url)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self._size_bytes += len(content) - previous_size
+            if self.max_size_bytes is not None and self._size_bytes > self.max_size_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_atime)
+        self._size_bytes = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._size_bytes <= self.max_size_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._size_bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in self._entries():
+                os.remove(entry.path)
+            self._size_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'size_bytes': self._size_bytes,
+                    'cache_dir': self.cache_dir,
+                    'offline': self.offline}
+
+
+_response_cache: ResponseCache = None
+
+
+def enable_cache(cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = None, max_size_bytes: int = None,
+                 offline: bool = False) -> ResponseCache:
+    global _response_cache
+    _response_cache = ResponseCache(cache_dir, ttl, max_size_bytes, offline)
+
+    return _response_cache
+
+
+def disable_cache() -> None:
+    global _response_cache
+    _response_cache = None
+
+
+def get_cache() -> ResponseCache:
+    return _response_cache
+
+
+def cache_stats() -> dict:
+    if _response_cache is None:
+        return {'hits': 0, 'misses': 0, 'size_bytes': 0, 'cache_dir': None, 'offline': False}
+
+    return _response_cache.stats()
@@ -1,9 +1,188 @@
+import hashlib
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from .cache_utils import get_cache
+
+DEFAULT_TIMEOUT = (10, 300)  # (connect, read) in seconds
+DEFAULT_RETRIES = 4
+DEFAULT_BACKOFF = 1.
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_PER_HOST = 4
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+class RetryableStatusError(Exception):
+    # 429 / 5xx answer to a streamed download, retried with backoff like the network errors
+    pass
+
+
+_thread_local = threading.local()
+_host_semaphores = defaultdict(lambda: threading.BoundedSemaphore(DEFAULT_MAX_PER_HOST))
+_host_semaphores_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    # One keep-alive session per thread: requests.Session is not guaranteed to be thread safe
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=DEFAULT_MAX_PER_HOST, pool_maxsize=DEFAULT_MAX_PER_HOST)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _thread_local.session = session
 
+    return session
 
-def try_download(url):
-    response = requests.get(url)
+
+def set_max_per_host(host: str, max_connections: int) -> None:
+    with _host_semaphores_lock:
+        _host_semaphores[host] = threading.BoundedSemaphore(max_connections)
+
+
+def _get_host_semaphore(url: str) -> threading.BoundedSemaphore:
+    with _host_semaphores_lock:
+        return _host_semaphores[urlsplit(url).netloc]
+
+
+def _get_with_retry(url: str, timeout, retries: int, backoff: float, **kwargs) -> requests.Response:
+    session = get_session()
+    for attempt in range(retries + 1):
+        try:
+            with _get_host_semaphore(url):
+                response = session.get(url, timeout=timeout, **kwargs)
+        except RETRY_EXCEPTIONS:
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                return response
+        time.sleep(backoff * 2 ** attempt)
+
+
+def _response_from_cache(url: str, content: bytes) -> requests.Response:
+    response = requests.Response()
+    response._content = content
+    response.status_code = 200
+    response.url = url
+
+    return response
+
+
+def try_download(url, timeout=DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF,
+                 use_cache: bool = True):
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        content = cache.get(url)
+        if content is not None:
+            return _response_from_cache(url, content)
+
+    response = _get_with_retry(url, timeout, retries, backoff)
     if response.status_code != 200:
         raise Exception(r"Didn't work, response.status_code = " + str(response.status_code) + ", url = " + url)
 
+    if cache is not None:
+        cache.put(url, response.content)
+
     return response
+
+
+def fetch_many(urls, max_workers: int = DEFAULT_MAX_WORKERS, raise_errors: bool = True, **kwargs):
+    # Yields (url, response) as downloads complete, in completion order.
+    # With raise_errors=False, failed urls are yielded as (url, exception) instead of raising.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(try_download, url, **kwargs): url for url in urls}
+        try:
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    yield url, future.result()
+                except Exception as e:
+                    if raise_errors:
+                        raise
+                    yield url, e
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def file_sha256(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def _stream_to_part_file(url: str, part_path: str, timeout, chunk_size: int) -> int:
+    # Resumes from the bytes already in part_path when the server honours the Range header.
+    # Returns the total size announced by the server, or -1 if unknown.
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    # identity encoding so that Content-Length matches the bytes written to disk
+    headers = {'Accept-Encoding': 'identity'}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+    with _get_host_semaphore(url):
+        with get_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 416:
+                return offset
+            if response.status_code == 200:
+                offset = 0
+            elif response.status_code != 206:
+                error = RetryableStatusError if response.status_code in RETRY_STATUS_CODES else Exception
+                raise error(r"Didn't work, response.status_code = " + str(response.status_code) + ", url = " + url)
+            content_length = response.headers.get('Content-Length')
+            total_size = offset + int(content_length) if content_length is not None else -1
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+
+    return total_size
+
+
+def download_to_file(url: str, file_path: str, expected_size: int = None, sha256: str = None,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE, timeout=DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                     backoff: float = DEFAULT_BACKOFF) -> str:
+    # An existing file is only reused when it can be validated: without expected_size or sha256 it may be an older
+    # version of the resource, and the download starts again (only .part files of interrupted downloads resume).
+    if os.path.exists(file_path) and (expected_size is not None or sha256 is not None):
+        size_ok = expected_size is None or os.path.getsize(file_path) == expected_size
+        if size_ok and (sha256 is None or file_sha256(file_path) == sha256):
+            return file_path
+
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    part_path = file_path + '.part'
+    for attempt in range(retries + 1):
+        try:
+            total_size = _stream_to_part_file(url, part_path, timeout, chunk_size)
+        except RETRY_EXCEPTIONS + (RetryableStatusError,):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+            continue
+        downloaded_size = os.path.getsize(part_path)
+        if total_size == -1 or downloaded_size == total_size:
+            break
+        if attempt == retries:
+            raise IOError(f"Incomplete download of {url}: got {downloaded_size} of {total_size} bytes")
+        time.sleep(backoff * 2 ** attempt)
+
+    if expected_size is not None and downloaded_size != expected_size:
+        os.remove(part_path)
+        raise IOError(f"Size mismatch for {url}: expected {expected_size} bytes, got {downloaded_size}")
+    if sha256 is not None and file_sha256(part_path) != sha256:
+        os.remove(part_path)
+        raise IOError(f"Checksum mismatch for {url}")
+    os.replace(part_path, file_path)
+
+    return file_path
@@ -1,5 +1,9 @@
 import json
 import os
+import re
+
+import numpy as np
+
 from utils import try_download
 
 
@@ -19,3 +23,76 @@ def save_json(json_data: json, save_path) -> None:
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
     with open(save_path, 'w') as f:
         json.dump(json_data, f, indent=4)
+
+
+_STRING_LITERAL = re.compile(rb'"(?:[^"\\]|\\.)*"')
+
+
+def _nesting_depth(prefix: bytes) -> int:
+    # Depth of the position that follows prefix (1 inside the top-level object), -1 if it is inside a string
+    structure = _STRING_LITERAL.sub(b'', prefix)
+    if b'"' in structure:
+        return -1
+
+    return structure.count(b'{') + structure.count(b'[') - structure.count(b'}') - structure.count(b']')
+
+
+def _find_array_span(payload: bytes, field: str):
+    # Start and end (exclusive) of the numeric array value of a top-level field, (-1, -1) if it is not a key of
+    # the top-level object, None if it is there more than once (duplicate keys are left to json).
+    # Numbers and null never contain brackets, so a flat array ends at the first ']' and an array of
+    # rows at the first ']]'.
+    pattern = re.compile(rb'"' + re.escape(field.encode()) + rb'"\s*:\s*\[\s*(\[)?')
+    matches = [match for match in pattern.finditer(payload) if _nesting_depth(payload[:match.start()]) == 1]
+    if not matches:
+        return -1, -1
+    if len(matches) > 1:
+        return None
+    match = matches[0]
+    start = match.start() + match.group(0).index(b'[')
+    if match.group(1) is None:
+        end = payload.index(b']', start) + 1
+    else:
+        end = re.compile(rb'\]\s*\]').search(payload, start).end()
+
+    return start, end
+
+
+def decode_json_with_arrays(payload: bytes, array_fields: dict) -> dict:
+    # Decodes the numeric arrays listed in array_fields ({field: dtype}) straight from the raw payload into
+    # typed numpy arrays, without building Python lists of floats; null values become NaN.
+    # The rest of the document is decoded with json as usual.
+    spans = [(_find_array_span(payload, field), field) for field in array_fields]
+    if any(span is None for span, _ in spans):
+        json_data = json.loads(payload)
+        for field, dtype in array_fields.items():
+            if isinstance(json_data.get(field), list):
+                json_data[field] = np.asarray(json_data[field], dtype=dtype)
+
+        return json_data
+
+    arrays = {}
+    skeleton_parts = []
+    position = 0
+    for (start, end), field in sorted(spans):
+        if start == -1:
+            continue
+        text = payload[start:end]
+        n_rows = text.count(b']') - 1
+        # Comma-separated values parsed by numpy directly into the requested dtype, with the same floats as json
+        flat_text = text.translate(None, b'[] \t\r\n').replace(b'null', b'nan')
+        if flat_text:
+            values = np.fromstring(flat_text, dtype=array_fields[field], sep=',')
+            if len(values) != flat_text.count(b',') + 1:
+                raise ValueError(f"Invalid number in the {field} array")
+        else:
+            values = np.empty(0, dtype=array_fields[field])
+        arrays[field] = values.reshape(n_rows, -1) if n_rows > 0 else values
+        skeleton_parts.extend((payload[position:start], b'null'))
+        position = end
+    skeleton_parts.append(payload[position:])
+
+    json_data = json.loads(b''.join(skeleton_parts))
+    json_data.update(arrays)
+
+    return json_data
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class SortedAxis:
+    def __init__(self, values):
+        # 1D coordinate axis (depths, layers...) sorted once, queried by binary search.
+        # Returned indices always refer to the original, unsorted order.
+        self.values = np.asarray(values, dtype=float).ravel()
+        if len(self.values) == 0:
+            raise ValueError("Array must be longer than len(0) to find index of value")
+        self.order = np.argsort(self.values, kind='stable')
+        self.sorted_values = self.values[self.order]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def nearest(self, targets):
+        # Index of the closest value for a scalar or an array of targets. On ties the value appearing first
+        # in the original array wins, like np.abs(values - target).argmin().
+        targets = np.asarray(targets, dtype=float)
+        right = np.clip(np.searchsorted(self.sorted_values, targets, side='left'), 0, len(self) - 1)
+        # Equal values sit next to each other: step back to the first of a run so that stable order applies
+        right = np.searchsorted(self.sorted_values, self.sorted_values[right], side='left')
+        left = np.searchsorted(self.sorted_values, self.sorted_values[np.maximum(right - 1, 0)], side='left')
+        left_distance = np.abs(targets - self.sorted_values[left])
+        right_distance = np.abs(self.sorted_values[right] - targets)
+        left_index = self.order[left]
+        right_index = self.order[right]
+        use_left = (left_distance < right_distance) | ((left_distance == right_distance) & (left_index < right_index))
+        indices = np.where(use_left, left_index, right_index)
+
+        return int(indices) if indices.ndim == 0 else indices
+
+    def bracket(self, targets) -> tuple:
+        # (lower index, upper index, upper weight) of the two values surrounding each target, for linear
+        # interpolation: value = (1 - weight) * data[lower] + weight * data[upper].
+        # Targets outside the axis are clamped to the closest end value: below the first value the weight is 0
+        # on the first pair, above the last one it is 1 on the last pair.
+        targets = np.asarray(targets, dtype=float)
+        upper = np.clip(np.searchsorted(self.sorted_values, targets, side='right'), 1, len(self) - 1)
+        lower = upper - 1 if len(self) > 1 else upper
+        lower_values = self.sorted_values[lower]
+        spacing = self.sorted_values[upper] - lower_values
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = np.where(spacing > 0, (targets - lower_values) / spacing, 0.)
+        weights = np.clip(weights, 0., 1.)
+
+        return self.order[lower], self.order[upper], weights
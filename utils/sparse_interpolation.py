@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+
+from .spatial_index import (SpatialIndex,
+                            build_spatial_index)
+
+REGRIDDER_SUFFIX = '.regrid.npz'
+LOCAL_SIZE_NEIGHBOURS = 4
+# Used faces of a mesh closer than READ_GAP are read in one run of at most READ_RUN faces: reading the faces
+# between them is cheaper than another read call (netCDF4 reads irregular integer indices one at a time)
+READ_GAP = 512
+READ_RUN = 4096
+
+_raster_regridders = {}
+
+
+def typical_cell_size(spatial_index: SpatialIndex) -> float:
+    # Median distance between neighbouring cell centres
+    if len(spatial_index) < 2:
+        return 1.
+    neighbour_distances, _ = spatial_index.tree.query(spatial_index.points, k=2)
+
+    return float(np.median(neighbour_distances[:, 1]))
+
+
+def local_cell_sizes(spatial_index: SpatialIndex) -> np.ndarray:
+    # Size of the cell around each cell centre, which unlike typical_cell_size follows the refinement of
+    # variable-resolution grids: the largest spacing to its neighbours along the grid lines on structured grids,
+    # the distance to its 4th closest cell centre on meshes (and for cells without valid grid neighbours).
+    neighbours = min(LOCAL_SIZE_NEIGHBOURS + 1, len(spatial_index))
+    if neighbours < 2:
+        return np.ones(len(spatial_index))
+    neighbour_distances, _ = spatial_index.tree.query(spatial_index.points, k=neighbours)
+    cell_sizes = neighbour_distances[:, -1]
+    if len(spatial_index.grid_shape) != 2:
+        return cell_sizes
+
+    grid_points = np.full((int(np.prod(spatial_index.grid_shape)), 2), np.nan)
+    grid_points[spatial_index.cell_ids] = spatial_index.points
+    grid_points = grid_points.reshape(spatial_index.grid_shape + (2,))
+    grid_sizes = np.full(spatial_index.grid_shape, np.nan)
+    for axis in (0, 1):
+        spacings = np.hypot(*np.moveaxis(np.diff(grid_points, axis=axis), -1, 0))
+        before = [(0, 0), (0, 0)]
+        before[axis] = (1, 0)
+        after = [(0, 0), (0, 0)]
+        after[axis] = (0, 1)
+        grid_sizes = np.fmax(grid_sizes, np.fmax(np.pad(spacings, before, constant_values=np.nan),
+                                                 np.pad(spacings, after, constant_values=np.nan)))
+    grid_sizes = grid_sizes.ravel()[spatial_index.cell_ids]
+
+    return np.where(np.isnan(grid_sizes), cell_sizes, grid_sizes)
+
+
+def interpolation_weights(spatial_index: SpatialIndex, points: np.ndarray, neighbours: int = 1,
+                          max_distance: float = None) -> tuple[sparse.csr_matrix, np.ndarray]:
+    # (point x used cell) inverse-distance weights of the closest cells of each point, and the flat grid index of
+    # the used cells. Points whose closest cell is further than max_distance get no weight (NaN once applied). By
+    # default max_distance is the local size of that closest cell, np.inf disables the cut-off.
+    neighbours = min(neighbours, len(spatial_index))
+    cell_distances, rows = spatial_index.tree.query(points, k=neighbours)
+    cell_distances = cell_distances.reshape(len(points), neighbours)
+    rows = rows.reshape(len(points), neighbours)
+
+    if max_distance is None:
+        max_distance = local_cell_sizes(spatial_index)[rows[:, :1]]
+    inside = cell_distances[:, :1] <= max_distance
+    weights = np.where(cell_distances <= max_distance, 1. / np.maximum(cell_distances, 1e-9), 0.) * inside
+    weights /= np.maximum(weights.sum(axis=1, keepdims=True), 1e-300)
+
+    cells, cell_columns = np.unique(spatial_index.cell_ids[rows], return_inverse=True)
+    point_rows = np.repeat(np.arange(len(points)), neighbours)
+    weight_matrix = sparse.csr_matrix((weights.ravel(), (point_rows, cell_columns.ravel())),
+                                      shape=(len(points), len(cells)))
+    weight_matrix.eliminate_zeros()
+
+    return weight_matrix, cells
+
+
+def _face_runs(cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Run of each sorted face: runs break on gaps larger than READ_GAP and are at most READ_RUN faces long.
+    # Returns the run of each face and the first face of each run.
+    gap_runs = np.cumsum(np.concatenate(([True], np.diff(cells) > READ_GAP))) - 1
+    gap_starts = cells[np.flatnonzero(np.diff(gap_runs, prepend=-1))]
+    blocks = (cells - gap_starts[gap_runs]) // READ_RUN
+    new_run = np.concatenate(([True], (np.diff(gap_runs) > 0) | (np.diff(blocks) > 0)))
+
+    return np.cumsum(new_run) - 1, cells[new_run]
+
+
+class SparseInterpolator:
+    def __init__(self, weights: sparse.csr_matrix, cells: np.ndarray, grid_shape: tuple):
+        # weights: (target x used cell) matrix, cells: flat grid index of the used cells.
+        # Only the box of the grid that contains them needs to be read.
+        self.weights = weights.tocsr()
+        self.cells = cells
+        self.grid_shape = tuple(int(size) for size in grid_shape)
+        if len(self.grid_shape) == 1:
+            # The used faces of an unstructured (1D) mesh are spread over the whole face axis: they are read by
+            # runs of nearby faces, from which only the used ones are kept (in the order of cells)
+            cells = np.asarray(cells, dtype='int64')
+            if len(cells):
+                cell_runs, starts = _face_runs(cells)
+                stops = cells[np.flatnonzero(np.diff(cell_runs, append=len(starts)))] + 1
+                self.box = tuple(slice(int(start), int(stop)) for start, stop in zip(starts, stops))
+                self.box_runs = np.split(cells - starts[cell_runs], np.flatnonzero(np.diff(cell_runs)) + 1)
+            else:
+                self.box = (slice(0, 0),)
+                self.box_runs = [cells]
+            self.box_cells = np.arange(len(cells))
+        else:
+            cell_indices = np.unravel_index(cells, self.grid_shape)
+            self.box = tuple(slice(int(indices.min()), int(indices.max()) + 1) if len(cells) else slice(0, 0)
+                             for indices in cell_indices)
+            box_shape = tuple(box_slice.stop - box_slice.start for box_slice in self.box)
+            self.box_cells = np.ravel_multi_index(tuple(indices - box_slice.start
+                                                        for indices, box_slice in zip(cell_indices, self.box)),
+                                                  box_shape)
+
+    def read_box(self, nc_variable, index: list, cell_axis: int):
+        # nc_variable[index] with the cell dimensions, from cell_axis, restricted to the box (only the used cells
+        # on meshes): the values to interpolate with in_box=True. The other entries of index select the remaining
+        # dimensions.
+        index = list(index)
+        if len(self.grid_shape) > 1:
+            index[cell_axis:cell_axis + len(self.grid_shape)] = self.box
+            return nc_variable[tuple(index)]
+
+        # Axis of the faces once the dimensions selected with an integer are dropped
+        result_axis = cell_axis - sum(1 for key in index[:cell_axis] if isinstance(key, (int, np.integer)))
+        runs = []
+        for run, run_cells in zip(self.box, self.box_runs):
+            index[cell_axis] = run
+            runs.append(np.ma.asarray(nc_variable[tuple(index)]).take(run_cells, axis=result_axis))
+
+        return np.ma.concatenate(runs, axis=result_axis)
+
+    def interpolate(self, values, cell_axis: int = None, in_box: bool = False) -> np.ndarray:
+        # values: array whose cell dimensions (the grid dimensions, from cell_axis, last ones by default) are
+        # replaced by one dimension of targets. Every other dimension (time, layer...) goes through one sparse
+        # matrix product. NaN cells are left out and the weights of the remaining ones renormalised.
+        values = np.asarray(values, dtype='float64')
+        n_cell_dims = len(self.grid_shape)
+        cell_axis = values.ndim - n_cell_dims if cell_axis is None else cell_axis % values.ndim
+        values = np.moveaxis(values, list(range(cell_axis, cell_axis + n_cell_dims)),
+                             list(range(values.ndim - n_cell_dims, values.ndim)))
+        other_shape = values.shape[:values.ndim - n_cell_dims]
+        flat_values = values.reshape(-1, int(np.prod(values.shape[values.ndim - n_cell_dims:])))
+        cell_values = flat_values[:, self.box_cells if in_box else self.cells].T
+
+        valid = ~np.isnan(cell_values)
+        weighted_sum = self.weights @ np.where(valid, cell_values, 0.)
+        weight_sum = self.weights @ valid.astype('float64')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            targets = np.where(weight_sum > 0, weighted_sum / weight_sum, np.nan)
+
+        return targets.T.reshape(other_shape + (self.weights.shape[0],))
+
+    def _arrays(self) -> dict:
+        return {'cells': self.cells, 'grid_shape': np.array(self.grid_shape), 'weights_data': self.weights.data,
+                'weights_indices': self.weights.indices, 'weights_indptr': self.weights.indptr,
+                'weights_shape': np.array(self.weights.shape)}
+
+    @staticmethod
+    def _weights_from_arrays(saved) -> sparse.csr_matrix:
+        return sparse.csr_matrix((saved['weights_data'], saved['weights_indices'], saved['weights_indptr']),
+                                 shape=tuple(saved['weights_shape']))
+
+    def save(self, file_path: str) -> None:
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **self._arrays())
+        os.replace(temp_path, file_path)
+
+
+class RasterRegridder(SparseInterpolator):
+    def __init__(self, weights: sparse.csr_matrix, cells: np.ndarray, grid_shape: tuple, x_pixels: np.ndarray,
+                 y_pixels: np.ndarray):
+        super().__init__(weights, cells, grid_shape)
+        self.x_pixels = x_pixels
+        self.y_pixels = y_pixels
+
+    @property
+    def raster_shape(self) -> tuple:
+        return len(self.y_pixels), len(self.x_pixels)
+
+    def apply(self, values, cell_axis: int = None, in_box: bool = False) -> np.ndarray:
+        # Same as interpolate, with the cell dimensions replaced by (y, x)
+        pixels = self.interpolate(values, cell_axis, in_box)
+
+        return pixels.reshape(pixels.shape[:-1] + self.raster_shape)
+
+    def _arrays(self) -> dict:
+        return {**super()._arrays(), 'x_pixels': self.x_pixels, 'y_pixels': self.y_pixels}
+
+    @classmethod
+    def load(cls, file_path: str):
+        with np.load(file_path) as saved:
+            return cls(cls._weights_from_arrays(saved), saved['cells'], saved['grid_shape'], saved['x_pixels'],
+                       saved['y_pixels'])
+
+
+def build_raster_regridder(x_array, y_array, bbox: tuple, resolution: float, neighbours: int = 1,
+                           max_distance: float = None, mask_zero: bool = False,
+                           spatial_index: SpatialIndex = None) -> RasterRegridder:
+    # bbox: (x_min, x_max, y_min, y_max) of the raster, resolution: pixel size in the grid units.
+    # Pixels further than max_distance (the local size of their closest cell by default) from any cell are NaN.
+    # spatial_index: index of the grid already built with the same mask_zero, if the caller has one.
+    spatial_index = build_spatial_index(x_array, y_array, mask_zero) if spatial_index is None else spatial_index
+    x_min, x_max, y_min, y_max = bbox
+    x_pixels = np.arange(min(x_min, x_max) + resolution / 2, max(x_min, x_max), resolution)
+    y_pixels = np.arange(min(y_min, y_max) + resolution / 2, max(y_min, y_max), resolution)
+    x_grid, y_grid = np.meshgrid(x_pixels, y_pixels)
+    weights, cells = interpolation_weights(spatial_index, np.column_stack((x_grid.ravel(), y_grid.ravel())),
+                                           neighbours, max_distance)
+
+    return RasterRegridder(weights, cells, spatial_index.grid_shape, x_pixels, y_pixels)
+
+
+def get_raster_regridder(x_array, y_array, bbox: tuple, resolution: float, neighbours: int = 1,
+                         max_distance: float = None, mask_zero: bool = False,
+                         cache_folder: str = None) -> RasterRegridder:
+    # Regridder cached per (mesh, bbox, resolution, max_distance) in memory, and on disk in cache_folder if given
+    x_array = np.ascontiguousarray(np.ma.filled(np.ma.asarray(x_array, dtype=float), np.nan))
+    y_array = np.ascontiguousarray(np.ma.filled(np.ma.asarray(y_array, dtype=float), np.nan))
+    max_distance = None if max_distance is None else float(max_distance)
+    parameters = json.dumps([[float(value) for value in bbox], resolution, neighbours, max_distance, mask_zero])
+    key = hashlib.sha256(x_array.tobytes() + y_array.tobytes() + str(x_array.shape).encode('utf-8')
+                         + parameters.encode('utf-8')).hexdigest()[:32]
+    if key in _raster_regridders:
+        return _raster_regridders[key]
+
+    cache_path = os.path.join(cache_folder, key + REGRIDDER_SUFFIX) if cache_folder is not None else None
+    if cache_path is not None and os.path.exists(cache_path):
+        regridder = RasterRegridder.load(cache_path)
+    else:
+        regridder = build_raster_regridder(x_array, y_array, bbox, resolution, neighbours, max_distance,
+                                           mask_zero)
+        if cache_path is not None:
+            try:
+                os.makedirs(cache_folder, exist_ok=True)
+                regridder.save(cache_path)
+            except OSError:
+                # Read-only cache folder: keep the in-memory regridder only
+                pass
+    _raster_regridders[key] = regridder
+
+    return regridder
@@ -0,0 +1,119 @@
+import hashlib
+import os
+
+import netCDF4
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .cache_utils import INDEX_CACHE_DIR
+
+SPATIAL_INDEX_SUFFIX = '.kdtree.npz'
+
+_spatial_indexes = {}
+
+
+class SpatialIndex:
+    def __init__(self, points: np.ndarray, cell_ids: np.ndarray, grid_shape: tuple):
+        # points: (n, 2) coordinates of the valid cells, cell_ids: their flat index in a grid of shape grid_shape
+        self.points = points
+        self.cell_ids = cell_ids
+        self.grid_shape = tuple(grid_shape)
+        self.tree = cKDTree(points)
+
+    def __len__(self) -> int:
+        return len(self.cell_ids)
+
+    def query(self, x_coords, y_coords) -> tuple:
+        # Nearest valid cell of each (x, y), returned as a tuple of index arrays (one per grid dimension)
+        # together with the distances. Scalar coordinates give scalar indices.
+        x_coords = np.asarray(x_coords, dtype=float)
+        y_coords = np.asarray(y_coords, dtype=float)
+        distances, rows = self.tree.query(np.stack((x_coords, y_coords), axis=-1))
+        cell_indices = np.unravel_index(self.cell_ids[rows], self.grid_shape)
+
+        return cell_indices, distances
+
+    def query_one(self, x_coor: float, y_coor: float) -> tuple:
+        cell_indices, _ = self.query(x_coor, y_coor)
+
+        return tuple(int(index) for index in cell_indices)
+
+    def save(self, file_path: str, source_stamp: list) -> None:
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, points=self.points, cell_ids=self.cell_ids, grid_shape=np.array(self.grid_shape),
+                     source_stamp=np.array(source_stamp, dtype=float))
+        os.replace(temp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path: str):
+        with np.load(file_path) as saved:
+            return cls(saved['points'], saved['cell_ids'], saved['grid_shape']), saved['source_stamp'].tolist()
+
+
+def build_spatial_index(x_array, y_array, mask_zero: bool = True, valid_mask=None) -> SpatialIndex:
+    # x_array, y_array: cell centres of a structured grid (n, m) or face centres of an unstructured mesh (n,).
+    # NaN or masked coordinates are always excluded, X == 0 cells (inactive cells in Delft3D-FLOW) if mask_zero.
+    x_array = np.ma.filled(np.ma.asarray(x_array, dtype=float), np.nan)
+    y_array = np.ma.filled(np.ma.asarray(y_array, dtype=float), np.nan)
+    valid = np.isfinite(x_array) & np.isfinite(y_array)
+    if mask_zero:
+        valid &= x_array != 0
+    if valid_mask is not None:
+        valid &= np.asarray(valid_mask, dtype=bool)
+    cell_ids = np.flatnonzero(valid)
+    if len(cell_ids) == 0:
+        raise ValueError("No valid cell to build the spatial index")
+    points = np.column_stack((x_array.ravel()[cell_ids], y_array.ravel()[cell_ids]))
+
+    return SpatialIndex(points, cell_ids, x_array.shape)
+
+
+def _cache_path(file_path: str, x_name: str, y_name: str, mask_zero: bool, cache_folder: str) -> str:
+    key = f'{os.path.abspath(file_path)}|{x_name}|{y_name}|{mask_zero}'
+    file_name = os.path.basename(file_path) + '_' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+    return os.path.join(cache_folder, file_name + SPATIAL_INDEX_SUFFIX)
+
+
+def get_file_spatial_index(file_path: str, x_name: str, y_name: str, mask_zero: bool = True,
+                           cache_folder: str = None) -> SpatialIndex:
+    # Spatial index of the x_name / y_name coordinates of a NetCDF file, built once and cached in memory and
+    # on disk (in INDEX_CACHE_DIR by default). Cached indexes are rebuilt when the file size or mtime changes.
+    source_stamp = [os.path.getsize(file_path), os.path.getmtime(file_path)]
+    memory_key = (os.path.abspath(file_path), x_name, y_name, mask_zero)
+    cached = _spatial_indexes.get(memory_key)
+    if cached is not None and cached[1] == source_stamp:
+        return cached[0]
+
+    cache_folder = cache_folder if cache_folder is not None else INDEX_CACHE_DIR
+    cache_path = _cache_path(file_path, x_name, y_name, mask_zero, cache_folder)
+    spatial_index = None
+    if os.path.exists(cache_path):
+        spatial_index, cached_stamp = SpatialIndex.load(cache_path)
+        if cached_stamp != source_stamp:
+            spatial_index = None
+    if spatial_index is None:
+        with netCDF4.Dataset(file_path) as nc:
+            spatial_index = build_spatial_index(nc.variables[x_name][:], nc.variables[y_name][:], mask_zero)
+        try:
+            os.makedirs(cache_folder, exist_ok=True)
+            spatial_index.save(cache_path, source_stamp)
+        except OSError:
+            # Read-only cache folder: keep the in-memory index only
+            pass
+
+    _spatial_indexes[memory_key] = (spatial_index, source_stamp)
+
+    return spatial_index
+
+
+def get_flow_spatial_index(file_path: str, cache_folder: str = None) -> SpatialIndex:
+    # Delft3D-FLOW trim file: structured (n, m) grid of cell centres, X == 0 marks inactive cells
+    return get_file_spatial_index(file_path, 'XZ', 'YZ', mask_zero=True, cache_folder=cache_folder)
+
+
+def get_fm_spatial_index(file_path: str, cache_folder: str = None) -> SpatialIndex:
+    # Delft3D-FM map file: unstructured mesh faces
+    return get_file_spatial_index(file_path, 'mesh2d_face_x', 'mesh2d_face_y', mask_zero=False,
+                                  cache_folder=cache_folder)
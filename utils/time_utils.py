@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+
+def to_utc_datetime64(date) -> np.datetime64:
+    # datetime64[ns] of a date, tz-aware dates are converted to naive UTC
+    timestamp = pd.Timestamp(date)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert(None)
+
+    return timestamp.to_datetime64().astype('datetime64[ns]')
+
+
+def sorted_unique_time_order(times: np.ndarray) -> np.ndarray:
+    # Indices that sort times, without duplicates. Stable sort keeps the first occurrence of duplicated timestamps
+    order = np.argsort(times, kind='stable')
+    sorted_times = times[order]
+    keep = np.empty(len(sorted_times), dtype=bool)
+    keep[:1] = True
+    keep[1:] = sorted_times[1:] != sorted_times[:-1]
+
+    return order[keep]